@@ -1,23 +1,29 @@
 from django.shortcuts import get_object_or_404
 import json
 import secrets
-import base64
-import requests
 from django.utils import timezone
 from rest_framework import status
 from twilio.rest import Client
 from django.contrib.auth.hashers import check_password
-from django.core.files.base import ContentFile
 from django.conf import settings
-from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes, renderer_classes
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from .models import Product, Redeem, Category, Brand, Banner, Ad, Hero, Order, OrderItem, Payment, AppUser, Address, Discount
-from .serializers import CategorySerializer, DiscountValidateSerializer, BrandSerializer, BannerSerializer, HeroSerializer, AdSerializer, ProductSerializer, RedeemSerializer, OrderSerializer, AppUserSerializer, AddressSerializer
+from rest_framework.settings import api_settings
+from . import ingest, orders, product_cache, search, snapshots, sync, uploads
+from .conditional import home_condition, section_condition
+from .models import Product, Order, OrderItem, Payment, AppUser, Address, Discount
+from .pagination import ProductSearchPagination
+from .renderers import NDJSONRenderer
+from .serializers import DiscountValidateSerializer, ProductSerializer, OrderSerializer, AppUserSerializer, AddressSerializer
+from .streaming import stream_list
 
 client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
 
+# Large lists stream as a JSON array, or NDJSON with Accept: application/x-ndjson
+STREAMING_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
 
 #Mobile App User Creation API
 @api_view(["POST"])
@@ -135,10 +141,10 @@ def app_user_login(request):
 
 #Mobile App User List API
 @api_view(["GET"])
+@renderer_classes(STREAMING_RENDERERS)
 def app_user_list(request):
-    users = AppUser.objects.all().order_by("-created_at")
-    serializer = AppUserSerializer(users, many=True)
-    return Response(serializer.data)
+    users = AppUserSerializer.optimize_queryset(AppUser.objects.all().order_by("-created_at"), request.query_params)
+    return stream_list(request, users, AppUserSerializer, context={"query_params": request.query_params})
 
 
 #Mobile App User Delete API
@@ -157,57 +163,100 @@ def delete_user_address(request, pk):
 
 
 # Mobile App Category API
+@section_condition("categories")
 @api_view(['GET'])
 def category_list_api(request):
-    categories = Category.objects.all().order_by('-id')
-    serializer = CategorySerializer(categories, many=True, context={'request': request})
-    return Response(serializer.data)
+    return snapshots.serve(request, "categories")
+
 
 # Mobile App Brand API
+@section_condition("brands")
 @api_view(['GET'])
 def brand_list_api(request):
-    brands = Brand.objects.all().order_by('-id')
-    serializer = BrandSerializer(brands, many=True, context={'request': request})
-    return Response(serializer.data)
+    return snapshots.serve(request, "brands")
+
 
 # Mobile App Banner API
+@section_condition("banners")
 @api_view(['GET'])
 def banner_list_api(request):
-    banners = Banner.objects.all().order_by('-id')
-    serializer = BannerSerializer(banners, many=True, context={'request': request})
-    return Response(serializer.data)
+    return snapshots.serve(request, "banners")
+
 
 
 # Mobile App Ads API
+@section_condition("ads")
 @api_view(['GET'])
 def ad_list_api(request):
-    ads = Ad.objects.all().order_by('-id')
-    serializer = AdSerializer(ads, many=True, context={'request': request})
-    return Response(serializer.data)
+    return snapshots.serve(request, "ads")
+
 
 
 # Mobile App Hero API
+@section_condition("heros")
 @api_view(['GET'])
 def hero_list_api(request):
-    heros = Hero.objects.all().order_by('-id')
-    serializer = HeroSerializer(heros, many=True, context={'request': request})
-    return Response(serializer.data)
+    return snapshots.serve(request, "heros")
+
+
+
+# Mobile App Home Feed API (categories, brands, banners, ads, heros, redeems)
+@home_condition
+@api_view(['GET'])
+def home_feed_api(request):
+    return snapshots.serve_home(request)
 
 
 # Mobile App Product API
+@section_condition("products")
 @api_view(['GET'])
 def product_list_api(request):
-    products = Product.objects.all().order_by('-id')
-    serializer = ProductSerializer(products, many=True, context={'request': request})
-    return Response(serializer.data)
+    since = request.query_params.get("since")
+    if since is not None:
+        return Response(sync.product_delta(request, since))
+    return snapshots.serve(request, "products")
+
+
+
+# Mobile App Product Detail APIs (by id or slug)
+@api_view(['GET'])
+def product_detail_api(request, product):
+    return product_cache.serve(request, "detail", product)
+
+
+@api_view(['GET'])
+def product_variants_api(request, product):
+    return product_cache.serve(request, "variants", product)
+
+
+@api_view(['GET'])
+def product_options_api(request, product):
+    return product_cache.serve(request, "options", product)
+
+
+# ?values=<VariantValue ids> -> matching variant and still-available values
+@api_view(['GET'])
+def product_variant_resolve_api(request, product):
+    return product_cache.serve(request, "resolve", product)
+
+
+# Mobile App Product Search API
+@api_view(['GET'])
+def product_search_api(request):
+    ranked_ids = search.RankedProductIds(request.query_params.get("q", ""))
+    paginator = ProductSearchPagination()
+    page = paginator.paginate_queryset(ranked_ids, request)
+    products = ProductSerializer.optimize_queryset(Product.objects.all(), request.query_params).in_bulk(page)
+    serializer = ProductSerializer([products[pk] for pk in page if pk in products], many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 
 # Mobile App Redeem API
+@section_condition("redeems")
 @api_view(['GET'])
 def redeem_list_api(request):
-    redeems = Redeem.objects.all().order_by('-id')
-    serializer = RedeemSerializer(redeems, many=True, context={'request': request})
-    return Response(serializer.data)
+    return snapshots.serve(request, "redeems")
+
 
 
 
@@ -222,57 +271,75 @@ def create_order(request):
     except AppUser.DoesNotExist:
         return Response({"error": "Invalid user_id"}, status=400)
 
-    order = Order.objects.create(
-        user=app_user,   
-        address=data.get("address", ""),
-        shipping=data.get("shipping", ""),
-        status=data.get("status", "pending"),
-    )
-
+    items = []
+    decoded_files = []
     for item in data.get("product", []):
         image_data = item.get("image")
         image_file = None
+        image_url = ""
+        source = {}
 
         if isinstance(image_data, dict):
             image_data = image_data.get("uri")
 
         # 1. Base64 image
         if image_data and isinstance(image_data, str) and image_data.startswith("data:image"):
-            format, imgstr = image_data.split(";base64,")
-            ext = format.split("/")[-1]
-            image_file = ContentFile(base64.b64decode(imgstr), name=f"order_item.{ext}")
+            marker = image_data.find(";base64,")
+            try:
+                if marker == -1:
+                    raise ValueError("Not a base64 data URL.")
+                ext = image_data[:marker].split("/")[-1]
+                # Decoded in place to a spooled temp file, never a second copy in memory
+                image_file = uploads.decode_base64(image_data, f"order_item.{ext}", start=marker + len(";base64,"))
+                decoded_files.append(image_file)
+            except ValueError:
+                pass
 
         # 2. File object (direct upload)
         elif image_data and not isinstance(image_data, str):
             image_file = image_data
 
-        # 3. Agar URL aaya hai
-        elif image_data and isinstance(image_data, str) and image_data.startswith("http"):
-            try:
-                response = requests.get(image_data)
-                if response.status_code == 200:
-                    ext = image_data.split(".")[-1].split("?")[0]
-                    image_file = ContentFile(response.content, name=f"order_item.{ext}")
-            except Exception as e:
-                print("Image download failed:", e)
-
-        OrderItem.objects.create(
-            order=order,
+        else:
+            # 3. Catalog image (by id, content hash or our own media URL): shared, not copied
+            image_file, source = ingest.catalog_image(item)
+
+            # 4. Agar URL aaya hai: downloaded in the background after the response
+            if image_file is None and image_data and isinstance(image_data, str) and image_data.startswith("http"):
+                image_url = image_data[:1000]
+
+        items.append(OrderItem(
             image=image_file, 
+            image_url=image_url,
+            **source,
             name=item.get("name"),
             pts=item.get("pts", 0),
             variants=item.get("variants", ""),
             price=item.get("price", 0),
             quantity=item.get("quantity", 1),
-        )
+        ))
 
     # Payment loop
-    for pay in data.get("payment", []):
-        Payment.objects.create(
-            order=order,
-            method=pay.get("method", "Unknown"),
-            status=pay.get("status", "Pending"),
+    payments = [
+        Payment(method=pay.get("method", "Unknown"), status=pay.get("status", "Pending"))
+        for pay in data.get("payment", [])
+    ]
+
+    try:
+        # Items and payments inserted in bulk; the order is written once
+        order = orders.create(
+            items,
+            payments,
+            user=app_user,   
+            address=data.get("address", ""),
+            shipping=data.get("shipping", ""),
+            status=data.get("status", "pending"),
         )
+    finally:
+        for decoded in decoded_files:
+            decoded.close()
+
+    if any(item.image_url for item in items):
+        ingest.queue(order)
 
     return Response(
         {
@@ -305,10 +372,10 @@ def update_order_status(request, order_pk):
 
 
 @api_view(["GET"])
+@renderer_classes(STREAMING_RENDERERS)
 def list_orders(request):
-    orders = Order.objects.all().order_by("-created_at")
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    queryset = OrderSerializer.optimize_queryset(Order.objects.all().order_by("-created_at"), request.query_params)
+    return stream_list(request, queryset, OrderSerializer, context={"query_params": request.query_params})
 
 
 # from decimal import Decimal
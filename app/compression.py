@@ -0,0 +1,99 @@
+import gzip
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+# Preference order when a client accepts several
+ENCODINGS = ("br", "gzip")
+
+# Quality for bodies compressed once and cached vs. on every response
+CACHED_BROTLI_QUALITY = 11
+BROTLI_QUALITY = 5
+
+# Already compressed; gzip/br would only cost CPU (and break byte ranges)
+INCOMPRESSIBLE_TYPES = ("image/", "video/", "audio/", "font/woff", "application/zip", "application/gzip")
+COMPRESSIBLE_IMAGES = ("image/svg+xml",)
+
+re_coding = _lazy_re_compile(r"^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$")
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts (q > 0), from Accept-Encoding."""
+    accepted, refused = set(), set()
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").lower().split(","):
+        match = re_coding.match(part)
+        if not match:
+            continue
+        coding, q = match.groups()
+        try:
+            weight = float(q) if q is not None else 1.0
+        except ValueError:
+            continue
+        (accepted if weight > 0 else refused).add(coding)
+    if "*" in accepted:
+        accepted.update(coding for coding in ENCODINGS if coding not in refused)
+    return accepted
+
+
+def negotiate(request, available):
+    """Best coding in ``available`` the client accepts, or None for identity."""
+    accepted = accepted_encodings(request)
+    for coding in ENCODINGS:
+        if coding in available and coding in accepted:
+            return coding
+    return None
+
+
+def compress(body):
+    """Every encoding of ``body`` worth caching: {"gzip": bytes, "br": bytes}."""
+    encodings = {}
+    if getattr(settings, "CATALOG_SNAPSHOT_GZIP", True):
+        encodings["gzip"] = gzip.compress(body, mtime=0)
+    if brotli is not None and getattr(settings, "CATALOG_SNAPSHOT_BROTLI", True):
+        encodings["br"] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=CACHED_BROTLI_QUALITY)
+    return encodings
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware that answers with brotli when it's installed and preferred.
+
+    Responses that already carry a Content-Encoding (cached snapshots),
+    partial content and already-compressed media pass through untouched;
+    streaming responses are only ever gzipped.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding") or (not response.streaming and len(response.content) < 200):
+            return response
+        content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+        if response.status_code == 206 or (
+            content_type.startswith(INCOMPRESSIBLE_TYPES) and content_type not in COMPRESSIBLE_IMAGES
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        available = ENCODINGS if brotli is not None and not response.streaming else ("gzip",)
+        coding = negotiate(request, available)
+        if coding is None:
+            return response
+        if coding == "gzip":
+            return super().process_response(request, response)
+
+        compressed = brotli.compress(response.content, mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        # Same as GZipMiddleware: the body changed, so a strong ETag can't stay strong
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
@@ -0,0 +1,87 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from . import snapshots
+from .models import ChangeLog
+
+
+def _section_models(section):
+    return [model for model, sections in snapshots.DEPENDENCIES.items() if section in sections]
+
+
+def _model_state(request, model):
+    """(count, max pk, max updated_at) of a model, computed once per request."""
+    states = request.__dict__.setdefault("_model_states", {})
+    if model not in states:
+        aggregates = {"count": Count("pk"), "top": Max("pk")}
+        if any(field.name == "updated_at" for field in model._meta.get_fields()):
+            aggregates["updated"] = Max("updated_at")
+        row = model.objects.order_by().aggregate(**aggregates)
+        states[model] = (row["count"], row["top"], row.get("updated"))
+    return states[model]
+
+
+def fingerprint(request, name, models, params=()):
+    """Aggregate-only ETag for a payload built from ``models``.
+
+    Uses row counts plus max(pk)/max(updated_at), so nothing is serialized to
+    answer a conditional request.
+    """
+    fingerprints = request.__dict__.setdefault("_fingerprints", {})
+    if name in fingerprints:
+        return fingerprints[name]
+
+    parts = [name, request.get_host(), str(request.is_secure())]
+    for model in models:
+        count, top, updated = _model_state(request, model)
+        parts.append(f"{model._meta.label}:{count}:{top}:{updated and updated.isoformat()}")
+    parts.append(urlencode([(param, request.GET[param]) for param in params if param in request.GET]))
+
+    fingerprints[name] = 'W/"%s"' % hashlib.md5("|".join(parts).encode()).hexdigest()
+    return fingerprints[name]
+
+
+def last_modified(request, sections):
+    """Last-Modified for a payload built from ``sections``, or None.
+
+    max(updated_at) alone doesn't move on a delete, so this is the latest of
+    that, when the sections were last invalidated (snapshots.last_changed)
+    and, for products, the change log sync reads, which records deletes.
+    """
+    times = [snapshots.last_changed(section) for section in sections]
+    times += [_model_state(request, model)[2] for section in sections for model in _section_models(section)]
+    if "products" in sections:
+        times.append(ChangeLog.objects.order_by("-id").values_list("created_at", flat=True).first())
+    latest = max(moment for moment in times if moment)
+    # HTTP dates are whole seconds: a change later in this second wouldn't move
+    # the header, so only send it once the second is over
+    if int(latest.timestamp()) >= int(time.time()):
+        return None
+    return latest
+
+
+def section_etag(request, section):
+    return fingerprint(request, section, _section_models(section), snapshots.SECTIONS[section][1])
+
+
+def home_etag(request):
+    models = {model: None for section in snapshots.HOME_SECTIONS for model in _section_models(section)}
+    return fingerprint(request, "home", list(models))
+
+
+def section_condition(section):
+    """``condition`` decorator answering If-None-Match/If-Modified-Since for a section."""
+    return condition(
+        etag_func=lambda request, *args, **kwargs: section_etag(request, section),
+        last_modified_func=lambda request, *args, **kwargs: last_modified(request, (section,)),
+    )
+
+
+home_condition = condition(
+    etag_func=lambda request, *args, **kwargs: home_etag(request),
+    last_modified_func=lambda request, *args, **kwargs: last_modified(request, snapshots.HOME_SECTIONS),
+)
@@ -0,0 +1,108 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from rest_framework.exceptions import ValidationError
+
+from .models import Product
+
+# Query params accepted by the product list
+FILTER_PARAMS = ("category", "brand", "min_price", "max_price", "stock_status", "product_type")
+
+# Upper bounds of the price facet buckets; the last bucket is open-ended
+PRICE_BUCKETS = (500, 1000, 2500, 5000)
+
+
+def _price_param(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: "Enter a number."})
+
+
+def _id_or_slug(relation, values):
+    ids = [value for value in values if value.isdigit()]
+    slugs = [value for value in values if not value.isdigit()]
+    return Q(**{f"{relation}_id__in": ids}) | Q(**{f"{relation}__slug__in": slugs})
+
+
+def filter_products(queryset, params):
+    """Apply the product list filters in ``params`` (a QueryDict)."""
+    for relation in ("category", "brand"):
+        if params.get(relation):
+            queryset = queryset.filter(_id_or_slug(relation, params[relation].split(",")))
+
+    for name, choices in (("stock_status", Product.STOCK_CHOICES), ("product_type", Product.PRODUCT_TYPE_CHOICES)):
+        value = params.get(name)
+        if value:
+            if value not in dict(choices):
+                raise ValidationError({name: f"Choose one of {', '.join(dict(choices))}."})
+            queryset = queryset.filter(**{name: value})
+
+    min_price = _price_param(params, "min_price")
+    max_price = _price_param(params, "max_price")
+    # Product.effective_price is a maintained, indexed column
+    if min_price is not None:
+        queryset = queryset.filter(effective_price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(effective_price__lte=max_price)
+    return queryset
+
+
+def _bucket_label(index):
+    lower = 0 if index == 0 else PRICE_BUCKETS[index - 1]
+    if index == len(PRICE_BUCKETS):
+        return f"{lower}+"
+    return f"{lower}-{PRICE_BUCKETS[index]}"
+
+
+def price_bucket():
+    # Expects the effective price annotated as "price"
+    whens = [When(price__lt=bound, then=Value(_bucket_label(i))) for i, bound in enumerate(PRICE_BUCKETS)]
+    return Case(
+        When(price__isnull=True, then=Value(None)),
+        *whens,
+        default=Value(_bucket_label(len(PRICE_BUCKETS))),
+        output_field=CharField(),
+    )
+
+
+def product_facets(queryset):
+    """Counts per category, brand, stock status and price bucket in one grouped query."""
+    rows = (
+        queryset.order_by()
+        .alias(price=F("effective_price"))
+        .annotate(price_bucket=price_bucket())
+        .values(
+            "category_id", "category__name", "category__slug",
+            "brand_id", "brand__name", "brand__slug",
+            "stock_status", "price_bucket",
+        )
+        .annotate(count=Count("id"))
+    )
+
+    categories, brands, stock, prices = {}, {}, {}, {}
+    for row in rows:
+        count = row["count"]
+        category = categories.setdefault(row["category_id"], {
+            "id": row["category_id"], "name": row["category__name"], "slug": row["category__slug"], "count": 0,
+        })
+        category["count"] += count
+        if row["brand_id"] is not None:
+            brand = brands.setdefault(row["brand_id"], {
+                "id": row["brand_id"], "name": row["brand__name"], "slug": row["brand__slug"], "count": 0,
+            })
+            brand["count"] += count
+        stock[row["stock_status"]] = stock.get(row["stock_status"], 0) + count
+        if row["price_bucket"] is not None:
+            prices[row["price_bucket"]] = prices.get(row["price_bucket"], 0) + count
+
+    labels = [_bucket_label(i) for i in range(len(PRICE_BUCKETS) + 1)]
+    return {
+        "category": sorted(categories.values(), key=lambda item: item["name"]),
+        "brand": sorted(brands.values(), key=lambda item: item["name"]),
+        "stock_status": [{"value": value, "count": stock[value]} for value, _ in Product.STOCK_CHOICES if value in stock],
+        "price": [{"range": label, "count": prices[label]} for label in labels if label in prices],
+    }
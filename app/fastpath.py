@@ -0,0 +1,188 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+
+from . import renditions
+from .models import ProductImage, ProductVariant
+from .serializers import legacy_variant_attributes
+
+# Read-only serialization straight from .values() rows. Output must stay
+# byte-identical to the serializers in serializers.py, so keep each field list
+# in step with its serializer's Meta.fields.
+
+# (output key, values() column, converter name)
+# image_width/image_height/image_placeholder (app/placeholders.py)
+PLACEHOLDER_FIELDS = [
+    ("image_width", "image_width", None),
+    ("image_height", "image_height", None),
+    ("image_placeholder", "image_placeholder", None),
+]
+BRAND_FIELDS = [
+    ("id", "id", None),
+    ("name", "name", None),
+    ("slug", "slug", None),
+    ("image", "image", "image"),
+    ("image_srcset", "image", "srcset"),
+    ("created_at", "created_at", "datetime"),
+]
+CATEGORY_FIELDS = [
+    ("id", "id", None),
+    ("name", "name", None),
+    ("slug", "slug", None),
+    ("image", "image", "image"),
+    ("image_srcset", "image", "srcset"),
+    *PLACEHOLDER_FIELDS,
+    ("created_at", "created_at", "datetime"),
+]
+HERO_FIELDS = [
+    ("id", "id", None),
+    ("title", "title", None),
+    ("subtext", "subtext", None),
+    ("image", "image", "image"),
+    ("image_srcset", "image", "srcset"),
+    *PLACEHOLDER_FIELDS,
+    ("created_at", "created_at", "datetime"),
+]
+REDEEM_FIELDS = [
+    ("id", "id", None),
+    ("subtitle", "subtitle", None),
+    ("title", "title", None),
+    ("description", "description", None),
+    ("points_required", "points_required", None),
+    ("image", "image", "image"),
+    ("created_at", "created_at", "datetime"),
+    ("updated_at", "updated_at", "datetime"),
+]
+PRODUCT_IMAGE_FIELDS = [
+    ("id", "id", None),
+    ("image", "image", "image"),
+    ("image_srcset", "image", "srcset"),
+]
+PRODUCT_VARIANT_FIELDS = [
+    ("id", "id", None),
+    ("sku", "sku", None),
+    ("price", "price", "decimal"),
+    ("sale_price", "sale_price", "decimal"),
+    ("stock", "stock", None),
+    ("points", "points", None),
+    ("description", "description", None),
+    ("attributes", "attributes", None),
+    ("combination_key", "combination_key", None),
+    ("image", "image", "image"),
+    ("image_srcset", "image", "srcset"),
+]
+# gallery_images and variants are filled in by serialize_products
+PRODUCT_FIELDS = [
+    ("id", "id", None),
+    ("name", "name", None),
+    ("slug", "slug", None),
+    ("short_description", "short_description", None),
+    ("description", "description", None),
+    ("image", "image", "image"),
+    ("image_srcset", "image", "srcset"),
+    *PLACEHOLDER_FIELDS,
+    ("regular_price", "regular_price", "decimal"),
+    ("sale_price", "sale_price", "decimal"),
+    ("SKU", "SKU", None),
+    ("quantity", "quantity", None),
+    ("stock_status", "stock_status", None),
+    ("points", "points", None),
+    ("product_type", "product_type", None),
+    ("variant_count", "variant_count", None),
+    ("variant_stock", "variant_stock", None),
+    ("min_variant_price", "min_variant_price", "decimal"),
+    ("max_variant_price", "max_variant_price", "decimal"),
+    ("effective_price", "effective_price", "decimal"),
+    ("gallery_count", "gallery_count", None),
+    ("has_image", "has_image", None),
+    ("category", "category__name", None),
+    ("brand", "brand__name", None),
+    ("gallery_images", None, None),
+    ("variants", None, None),
+    ("created_at", "created_at", "datetime"),
+    ("updated_at", "updated_at", "datetime"),
+]
+
+
+def columns(fields):
+    return list(dict.fromkeys(column for _, column, _ in fields if column is not None))
+
+
+class RowConverter:
+    """Per-request value converters matching DRF's field ``to_representation``."""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.media_prefix = request.build_absolute_uri(settings.MEDIA_URL) if request is not None else settings.MEDIA_URL
+        self.tz = timezone.get_current_timezone()
+
+    def image(self, name):
+        if not name:
+            return None
+        # Dot segments get normalised by build_absolute_uri; let it handle them
+        if "/." in "/" + name:
+            url = default_storage.url(name)
+            return self.request.build_absolute_uri(url) if self.request is not None else url
+        return self.media_prefix + filepath_to_uri(name).lstrip("/")
+
+    def srcset(self, name):
+        names = renditions.srcset(name)
+        if names is None:
+            return None
+        return {width: self.image(rendition) for width, rendition in names.items()}
+
+    def datetime(self, value):
+        if not value:
+            return None
+        value = value.astimezone(self.tz).isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    def decimal(self, value):
+        if value is None:
+            return None
+        return "{:f}".format(value)
+
+    def compile(self, fields):
+        return [(key, column, getattr(self, kind) if kind else None) for key, column, kind in fields]
+
+
+def serialize_rows(rows, fields, converter):
+    compiled = converter.compile(fields)
+    return [
+        {key: (convert(row[column]) if convert else row[column]) if column else None for key, column, convert in compiled}
+        for row in rows
+    ]
+
+
+def serialize_queryset(queryset, fields, request=None):
+    return serialize_rows(queryset.values(*columns(fields)), fields, RowConverter(request))
+
+
+def serialize_products(rows, request=None):
+    """``rows`` are product ``.values(*columns(PRODUCT_FIELDS))`` dicts, in output order."""
+    converter = RowConverter(request)
+    ids = [row["id"] for row in rows]
+
+    gallery = defaultdict(list)
+    image_rows = ProductImage.objects.filter(product_id__in=ids).order_by("id").values("product_id", *columns(PRODUCT_IMAGE_FIELDS))
+    for image in serialize_rows(image_rows, PRODUCT_IMAGE_FIELDS + [("product_id", "product_id", None)], converter):
+        gallery[image.pop("product_id")].append(image)
+
+    variants = defaultdict(list)
+    variant_rows = ProductVariant.objects.filter(product_id__in=ids).order_by("id").values("product_id", *columns(PRODUCT_VARIANT_FIELDS))
+    for variant in serialize_rows(variant_rows, PRODUCT_VARIANT_FIELDS + [("product_id", "product_id", None)], converter):
+        variant["attributes"] = legacy_variant_attributes(
+            variant["attributes"], variant["sale_price"], variant["points"], variant["description"]
+        )
+        variants[variant.pop("product_id")].append(variant)
+
+    products = serialize_rows(rows, PRODUCT_FIELDS, converter)
+    for product in products:
+        product["gallery_images"] = gallery[product["id"]]
+        product["variants"] = variants[product["id"]]
+    return products
@@ -0,0 +1,266 @@
+import hashlib
+import logging
+import mimetypes
+import posixpath
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import unquote, urlsplit
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import renditions, storage
+from .models import MediaBlob, OrderItem, Product, ProductImage, ProductVariant
+from .tasks import run_in_queue
+
+logger = logging.getLogger(__name__)
+
+# Background queue the downloads run on (BACKGROUND_TASK_QUEUES sets its workers)
+QUEUE = "images"
+CHUNK_SIZE = 64 * 1024
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".avif"}
+
+_session = None
+_session_lock = threading.Lock()
+# Striped per-URL locks: concurrent jobs for the same URL download it once
+_url_locks = [threading.Lock() for _ in range(32)]
+
+
+def session():
+    """Shared requests session, so connections to an image host are reused."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            workers = getattr(settings, "BACKGROUND_TASK_QUEUES", {}).get(QUEUE) or 4
+            # Retry refused connections and gateway errors, never a slow read
+            retry = Retry(total=2, read=0, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=workers, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _cache_key(url):
+    return "order-image:" + hashlib.sha256(url.encode()).hexdigest()
+
+
+def _extension(url, content_type):
+    extension = posixpath.splitext(urlsplit(url).path)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return extension
+    return mimetypes.guess_extension(content_type) or ""
+
+
+def download(url):
+    """Store the image at ``url`` and return its name; raises on a bad response or oversized body."""
+    limit = getattr(settings, "ORDER_IMAGE_MAX_BYTES", 10 * 1024 * 1024)
+    deadline = time.monotonic() + getattr(settings, "ORDER_IMAGE_FETCH_DEADLINE", 30)
+    timeout = getattr(settings, "ORDER_IMAGE_FETCH_TIMEOUT", (3.05, 10))
+    with session().get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if not content_type.startswith("image/"):
+            raise ValueError(f"Not an image: {content_type or 'no Content-Type'}")
+        with tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE) as spool:
+            size = 0
+            # The read timeout is per chunk; the deadline stops a host that drips bytes
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise ValueError(f"Image is larger than {limit} bytes")
+                if time.monotonic() > deadline:
+                    raise ValueError("Image download took too long")
+                spool.write(chunk)
+            return default_storage.save(f"order_items/order_item{_extension(url, content_type)}", File(spool))
+
+
+def fetch(url):
+    """Stored name for the image at ``url``, downloading it only if no earlier job has."""
+    key = _cache_key(url)
+    with _url_locks[hash(url) % len(_url_locks)]:
+        name = cache.get(key)
+        if name and default_storage.exists(name):
+            return name
+        name = download(url)
+        cache.set(key, name, getattr(settings, "ORDER_IMAGE_URL_CACHE_TIMEOUT", 60 * 60 * 24 * 7))
+        return name
+
+
+def pending():
+    """Order items whose remote image isn't attached yet."""
+    return OrderItem.objects.exclude(image_url="").filter(Q(image="") | Q(image__isnull=True))
+
+
+def attach_order_images(order_id):
+    """Download the remote images of an order's items and attach them."""
+    items = pending().filter(order_id=order_id)
+    for item in items.select_related("order"):
+        try:
+            name = fetch(item.image_url)
+        except (requests.RequestException, ValueError, OSError) as exc:
+            logger.warning("Image for order item %s (%s) not attached: %s", item.pk, item.image_url, exc)
+            continue
+        item.image.name = name
+        item.save(update_fields=["image"])
+
+
+def queue(order):
+    run_in_queue(QUEUE, attach_order_images, order.pk)
+
+
+# Catalog image references
+
+def media_name(url):
+    """Stored name behind one of our own media URLs (renditions map to their source), else None."""
+    path = unquote(urlsplit(url).path)
+    media_path = urlsplit(settings.MEDIA_URL).path
+    if not path.startswith(media_path):
+        return None
+    name = path[len(media_path):]
+    source = renditions.source_name(name)
+    if source is not None:
+        name = source[0]
+    return name if name and default_storage.exists(name) else None
+
+
+def catalog_image(item):
+    """(image name, source fields) for an order item payload that points at a catalog image.
+
+    An image URL the item sends wins when it is one of our own media
+    URLs. Otherwise items may name the variant, gallery image or product
+    they were ordered from, or the sha256 of an image we store. Returns
+    (None, {}) when nothing matches.
+    """
+    image = item.get("image")
+    if isinstance(image, dict):
+        image = image.get("uri")
+    if isinstance(image, str) and image.startswith("http"):
+        name = media_name(image)
+        if name:
+            return name, {}
+
+    def ids(key):
+        value = item.get(key)
+        return int(value) if str(value or "").isdigit() else None
+
+    variant_id, image_id, product_id = ids("variant_id"), ids("product_image_id"), ids("product_id")
+    if variant_id:
+        variant = ProductVariant.objects.filter(pk=variant_id).values("image", "product_id").first()
+        if variant and variant["image"]:
+            return variant["image"], {"source_variant_id": variant_id, "source_product_id": variant["product_id"]}
+    if image_id:
+        image = ProductImage.objects.filter(pk=image_id).values("image", "product_id").first()
+        if image and image["image"]:
+            return image["image"], {"source_image_id": image_id, "source_product_id": image["product_id"]}
+    if variant_id and not product_id:
+        product_id = ProductVariant.objects.filter(pk=variant_id).values_list("product_id", flat=True).first()
+    if product_id:
+        name = Product.objects.filter(pk=product_id).values_list("image", flat=True).first()
+        if name:
+            return name, {"source_product_id": product_id}
+
+    digest = str(item.get("image_hash") or "").lower()
+    if len(digest) == 64 and all(char in "0123456789abcdef" for char in digest):
+        name = MediaBlob.objects.filter(name__startswith=storage.blob_name(digest)).values_list("name", flat=True).first()
+        if name:
+            return name, {}
+    return None, {}
+
+
+# Catalog models whose images order items may share
+CATALOG_IMAGE_MODELS = (Product, ProductVariant, ProductImage)
+
+
+def materialize(names):
+    """Give order items their own copy of catalog images that were replaced or deleted.
+
+    A blob needs nothing: the items' references keep it alive. A legacy
+    name no catalog row uses any more is stored content-addressed and the
+    items repointed, so clearing out old catalog folders can't break orders.
+    """
+    for name in set(names):
+        if storage.is_blob(name) or not default_storage.exists(name):
+            continue
+        items = OrderItem.objects.filter(image=name)
+        count = items.count()
+        if not count or any(model.objects.filter(image=name).exists() for model in CATALOG_IMAGE_MODELS):
+            continue
+        with default_storage.open(name) as source:
+            blob = default_storage.save(f"order_items/{posixpath.basename(name)}", source)
+        items.update(image=blob)
+        storage.track([name] * count, [blob] * count)
+
+
+def _digest(name):
+    try:
+        with default_storage.open(name) as content:
+            return storage.digest(content)[0]
+    except OSError:
+        return None
+
+
+def adopt_catalog_images(batch_size=500):
+    """Point order items whose file duplicates a catalog image at the catalog image instead.
+
+    Files are compared by content hash; the items' own copies are left for
+    the media GC. Returns how many items changed.
+    """
+    catalog = {}
+    sources = (
+        (ProductVariant, lambda row: {"source_variant_id": row["pk"], "source_product_id": row["product_id"]}),
+        (ProductImage, lambda row: {"source_image_id": row["pk"], "source_product_id": row["product_id"]}),
+        (Product, lambda row: {"source_product_id": row["pk"]}),
+    )
+    for model, fields in sources:
+        columns = ["pk", "image"] + (["product_id"] if model is not Product else [])
+        for row in model.objects.exclude(image="").exclude(image__isnull=True).values(*columns).iterator():
+            digest = _digest(row["image"])
+            if digest is not None and digest not in catalog:
+                catalog[digest] = (row["image"], fields(row))
+    if not catalog:
+        return 0
+
+    changed = 0
+    moved = Counter()
+    items = OrderItem.objects.exclude(image="").exclude(image__isnull=True).filter(
+        source_product__isnull=True, source_variant__isnull=True, source_image__isnull=True,
+    )
+    batch = []
+    for item in items.only("id", "image").iterator(chunk_size=batch_size):
+        match = catalog.get(_digest(item.image.name))
+        if match is None or match[0] == item.image.name:
+            continue
+        moved[item.image.name] -= 1
+        moved[match[0]] += 1
+        item.image = match[0]
+        for field, value in match[1].items():
+            setattr(item, field, value)
+        batch.append(item)
+        if len(batch) == batch_size:
+            changed += _save_adopted(batch)
+            batch = []
+    changed += _save_adopted(batch)
+
+    now = timezone.now()
+    for name, delta in moved.items():
+        if delta and storage.is_blob(name):
+            refcount = F("refcount") + delta if delta > 0 else Greatest(F("refcount") + delta, 0)
+            MediaBlob.objects.filter(name=name).update(refcount=refcount, updated_at=now)
+    return changed
+
+
+def _save_adopted(batch):
+    fields = ["image", "source_product", "source_variant", "source_image"]
+    OrderItem.objects.bulk_update(batch, fields)
+    return len(batch)
@@ -0,0 +1,54 @@
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+from app.models import Brand, Category, Product, ProductImage, ProductVariant
+
+
+@contextmanager
+def scratch_database():
+    """Run a benchmark against a throwaway test database, never the real one."""
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def best_of(func, repeat=5):
+    """Fastest of ``repeat`` runs, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def populate_catalog(count):
+    """``count`` categories and products, each product with two gallery images and two variants."""
+    categories = Category.objects.bulk_create(
+        Category(name=f"Category {i}", slug=f"category-{i}", image=f"category/images/{i}.png") for i in range(count)
+    )
+    brand = Brand.objects.create(name="Brand", slug="brand", image="brands/images/brand.png")
+    products = Product.objects.bulk_create(
+        Product(
+            name=f"Product {i}", slug=f"product-{i}", category=categories[i % len(categories)], brand=brand,
+            short_description="Short description", description="Long description " * 10,
+            image=f"products/main/{i}.jpg", regular_price="1250.00", sale_price="999.00", SKU=f"SKU-{i}",
+        )
+        for i in range(count)
+    )
+    ProductImage.objects.bulk_create(
+        ProductImage(product=product, image=f"products/gallery/{product.pk}-{n}.jpg")
+        for product in products for n in range(2)
+    )
+    ProductVariant.objects.bulk_create(
+        ProductVariant(
+            product=product, sku=f"V-{product.pk}-{n}", price="999.00", stock=5,
+            attributes={"options": {"Size": str(n)}}, image=f"products/variants/{product.pk}-{n}.jpg",
+        )
+        for product in products for n in range(2)
+    )
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app import ingest
+
+
+class Command(BaseCommand):
+    help = (
+        "Download and attach order item images that are still missing, e.g. queued before a restart "
+        "(the image queue lives in the web process). Safe to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age", type=int, default=300,
+            help="Skip orders younger than this many seconds; the web process may still be fetching them.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options["min_age"])
+        items = ingest.pending().filter(order__created_at__lte=cutoff)
+        order_ids = list(items.values_list("order_id", flat=True).distinct().order_by("order_id"))
+        missing = items.count()
+        for order_id in order_ids:
+            ingest.attach_order_images(order_id)
+        left = ingest.pending().filter(order_id__in=order_ids).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {len(order_ids)} order(s): attached {missing - left} image(s), {left} still missing."
+        ))
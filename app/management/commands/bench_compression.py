@@ -0,0 +1,46 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from app import compression
+from ._bench import populate_catalog, scratch_database
+
+# (label, Accept-Encoding, snapshot settings)
+MODES = [
+    ("identity", "", {}),
+    ("gzip per request", "gzip", {"CATALOG_SNAPSHOT_GZIP": False, "CATALOG_SNAPSHOT_BROTLI": False}),
+    ("br per request", "br", {"CATALOG_SNAPSHOT_GZIP": False, "CATALOG_SNAPSHOT_BROTLI": False}),
+    ("gzip cached", "gzip", {}),
+    ("br cached", "br", {}),
+]
+
+
+class Command(BaseCommand):
+    help = "Bytes on the wire and CPU per request for /api/products/ under each encoding."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=500)
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--requests", type=int, default=200)
+
+    def handle(self, *args, **options):
+        url = reverse("product-list-api") + f"?page_size={options['page_size']}"
+        client = Client(HTTP_HOST="localhost")
+        with scratch_database():
+            populate_catalog(options["products"])
+            self.stdout.write(f"{'mode':<18}{'bytes':>9}{'CPU ms/req':>12}")
+            for label, accept, overrides in MODES:
+                if label.startswith("br") and compression.brotli is None:
+                    self.stdout.write(f"{label:<18}{'brotli not installed':>21}")
+                    continue
+                with override_settings(**overrides):
+                    cache.clear()
+                    size = len(client.get(url, HTTP_ACCEPT_ENCODING=accept).content)  # warms the snapshot
+                    start = time.process_time()
+                    for _ in range(options["requests"]):
+                        client.get(url, HTTP_ACCEPT_ENCODING=accept)
+                    cpu = (time.process_time() - start) / options["requests"] * 1000
+                self.stdout.write(f"{label:<18}{size:>9,}{cpu:>12.2f}")
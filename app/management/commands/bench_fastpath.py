@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from app import fastpath, snapshots
+from app.models import Category, Product
+from app.serializers import CategorySerializer, ProductSerializer
+from ._bench import best_of, populate_catalog, scratch_database
+
+
+class Command(BaseCommand):
+    help = "Rows/sec of the .values() read path against the DRF serializers on a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        count, repeat = options["products"], options["repeat"]
+        request = snapshots.SnapshotRequest("https://shop.example", "/api/products/")
+        with scratch_database():
+            populate_catalog(count)
+            categories = Category.objects.order_by("-id")
+            products = Product.objects.order_by("-id")
+            cases = [
+                (
+                    "categories",
+                    categories.count(),
+                    lambda: CategorySerializer(categories.all(), many=True, context={"request": request}).data,
+                    lambda: fastpath.serialize_queryset(categories.all(), fastpath.CATEGORY_FIELDS, request),
+                ),
+                (
+                    "products",
+                    count,
+                    lambda: ProductSerializer(
+                        products.select_related("category", "brand").prefetch_related("gallery_images", "variants"),
+                        many=True, context={"request": request},
+                    ).data,
+                    lambda: fastpath.serialize_products(
+                        list(products.values(*fastpath.columns(fastpath.PRODUCT_FIELDS))), request
+                    ),
+                ),
+            ]
+            self.stdout.write(f"{'section':<12}{'rows':>8}{'DRF rows/s':>14}{'fast rows/s':>14}{'speedup':>9}")
+            for name, rows, slow, fast in cases:
+                slow_rate = rows / best_of(slow, repeat)
+                fast_rate = rows / best_of(fast, repeat)
+                self.stdout.write(f"{name:<12}{rows:>8}{slow_rate:>14,.0f}{fast_rate:>14,.0f}{fast_rate / slow_rate:>8.1f}x")
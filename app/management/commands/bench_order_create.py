@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app import orders
+from app.models import AppUser, Order, OrderItem
+from ._bench import best_of, scratch_database
+
+
+def item_fields(count):
+    return [
+        {"name": f"Item {i}", "pts": 10, "variants": "Size: M", "price": "999.00", "quantity": 1}
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Queries and time to create an order of 1, 10 and 100 items: per-item saves against orders.create."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100])
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        with scratch_database():
+            user = AppUser.objects.create(number="0300", password_hash="x")
+
+            def per_item(fields):
+                # What create_order used to do: every save re-derives and re-saves the order
+                order = Order.objects.create(user=user, address="Street", shipping="Standard")
+                for values in fields:
+                    OrderItem.objects.create(order=order, **values)
+
+            def bulk(fields):
+                orders.create([OrderItem(**values) for values in fields], user=user, address="Street", shipping="Standard")
+
+            self.stdout.write(
+                f"{'items':>6}{'per-item q':>12}{'bulk q':>8}{'per-item ms':>13}{'bulk ms':>9}{'speedup':>9}"
+            )
+            for size in options["sizes"]:
+                fields = item_fields(size)
+                queries, timings = [], []
+                for build in (per_item, bulk):
+                    with CaptureQueriesContext(connection) as captured:
+                        build(fields)
+                    queries.append(len(captured))
+                    timings.append(best_of(lambda: build(fields), repeat))
+                self.stdout.write(
+                    f"{size:>6}{queries[0]:>12}{queries[1]:>8}{timings[0] * 1000:>13.2f}{timings[1] * 1000:>9.2f}"
+                    f"{timings[0] / timings[1]:>8.1f}x"
+                )
@@ -0,0 +1,70 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from app import search
+from app.models import Brand, Category, Product
+from ._bench import best_of, scratch_database
+
+WORDS = (
+    "lube gel strawberry banana mint delay dotted ribbed ultra thin classic natural "
+    "fantasy scented pack family value gold silver intense warming cooling aloe"
+).split()
+
+QUERIES = ("gel", "strawberry pack", "ultra thin gold", "sku 4242", "zzz")
+
+
+def vocabulary(rng, size):
+    """Pseudo-words so descriptions are as sparse as real catalog copy."""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choices(letters, k=rng.randint(4, 9))) for _ in range(size)]
+
+
+class Command(BaseCommand):
+    help = "Compare LIKE product search against the FTS5 index on a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.populate(options["products"])
+            self.stdout.write(f"{'query':<18}{'matches':>9}{'LIKE ms':>10}{'FTS all ms':>12}{'FTS page ms':>13}")
+            for query in QUERIES:
+                like = lambda: list(  # noqa: E731 - mirrors the old views.product query
+                    Product.objects.filter(name__icontains=query).order_by("-id").values_list("id", flat=True)
+                )
+                fts_all = lambda: search.RankedProductIds(query)[:]  # noqa: E731
+                fts_page = lambda: search.RankedProductIds(query)[:20]  # noqa: E731
+                matches = search.RankedProductIds(query).count()
+                self.stdout.write(
+                    f"{query:<18}{matches:>9}"
+                    f"{best_of(like, options['repeat']) * 1000:>10.1f}"
+                    f"{best_of(fts_all, options['repeat']) * 1000:>12.1f}"
+                    f"{best_of(fts_page, options['repeat']) * 1000:>13.1f}"
+                )
+
+    def populate(self, count):
+        rng = random.Random(42)
+        names = WORDS + vocabulary(rng, 400)
+        prose = vocabulary(rng, 5000)
+        categories = [Category.objects.create(name=f"Category {i}", slug=f"category-{i}") for i in range(10)]
+        brands = [Brand.objects.create(name=f"Brand {i}", slug=f"brand-{i}") for i in range(20)]
+        Product.objects.bulk_create(
+            (
+                Product(
+                    name=" ".join(rng.sample(names, 3)).title(),
+                    slug=f"product-{i}",
+                    category=rng.choice(categories),
+                    brand=rng.choice(brands),
+                    short_description=" ".join(rng.sample(prose, 8)),
+                    description=" ".join(rng.choices(prose, k=40)),
+                    SKU=f"SKU-{i}",
+                    regular_price=rng.randint(100, 5000),
+                )
+                for i in range(count)
+            ),
+            batch_size=5000,
+        )
+        search.rebuild_index()
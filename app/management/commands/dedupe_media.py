@@ -0,0 +1,131 @@
+import os
+import shutil
+from collections import defaultdict
+
+from django.core.files.storage import storages
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from app import product_cache, renditions, snapshots, storage, sync
+from app.models import MediaBlob, Product
+
+
+def _link(source, target):
+    """Hard-link ``target`` to ``source``, replacing it; False if the filesystem can't."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = f"{target}.dedupe"
+    try:
+        os.link(source, temp)
+    except OSError:
+        return False
+    os.replace(temp, target)
+    return True
+
+
+def _derived(name):
+    """Renditions and sidecars of ``name`` that may already exist under the old name."""
+    names = [renditions.sidecar_name(name, ext) for ext in renditions.SIDECARS]
+    for width in renditions.widths():
+        rendition = renditions.rendition_name(name, width)
+        names.append(rendition)
+        names += [renditions.sidecar_name(rendition, ext) for ext in renditions.SIDECARS]
+    return names
+
+
+class Command(BaseCommand):
+    help = (
+        "Move every referenced media file into the content-addressed store, repoint the rows "
+        "at the blob names and hard-link the old paths to the blobs so old URLs keep working."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would change.")
+
+    def handle(self, *args, **options):
+        self.storage = storages["default"]
+        if not isinstance(self.storage, storage.ContentAddressedStorage):
+            raise CommandError("The default storage is not app.storage.ContentAddressedStorage.")
+        dry_run = options["dry_run"]
+
+        # {(model, field): set of legacy names it references}
+        referenced = defaultdict(set)
+        for model, fields in storage.file_fields().items():
+            for field in fields:
+                names = (
+                    model._base_manager.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+                    .values_list(field, flat=True).distinct()
+                )
+                referenced[model, field].update(name for name in names.iterator() if not storage.is_blob(name))
+
+        blobs, missing, saved = {}, 0, 0
+        seen = set()
+        for name in sorted(set().union(*referenced.values())):
+            if not self.storage.exists(name):
+                missing += 1
+                continue
+            with self.storage.open(name) as content:
+                sha, size = storage.digest(content)
+            blob = storage.blob_name(sha, os.path.splitext(name)[1])
+            blobs[name] = blob
+            if blob in seen or self.storage.exists(blob):
+                saved += size
+            seen.add(blob)
+            if not dry_run:
+                self._store(name, blob, size)
+
+        rows = 0
+        product_ids = set()
+        # Moving updated_at changes the aggregate ETags (app/conditional.py) along with the bodies
+        now = timezone.now()
+        for (model, field), names in referenced.items():
+            for name in names:
+                if name not in blobs:
+                    continue
+                matching = model._base_manager.filter(**{field: name})
+                if model is Product:
+                    product_ids.update(matching.values_list("pk", flat=True))
+                elif any(f.attname == "product_id" for f in model._meta.concrete_fields):
+                    product_ids.update(matching.values_list("product_id", flat=True))
+                if dry_run:
+                    rows += matching.count()
+                else:
+                    values = {field: blobs[name]}
+                    if any(f.name == "updated_at" for f in model._meta.concrete_fields):
+                        values["updated_at"] = now
+                    with transaction.atomic():
+                        rows += matching.update(**values)
+
+        summary = (
+            f"{len(blobs)} file(s) in {len(seen)} blob(s), {saved} byte(s) of duplicates, "
+            f"{rows} row(s) repointed, {missing} missing file(s)."
+        )
+        if dry_run:
+            self.stdout.write(f"Dry run: {summary}")
+            return
+
+        storage.recount()
+        # Products embed their gallery images and variants
+        Product.objects.filter(pk__in=product_ids).update(updated_at=now)
+        # Image URLs changed underneath every cached document
+        snapshots.invalidate(*snapshots.SECTIONS)
+        product_cache.invalidate_all()
+        sync.record_products(sorted(product_ids))
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def _store(self, name, blob, size):
+        path, blob_path = self.storage.path(name), self.storage.path(blob)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            if not _link(path, blob_path):
+                shutil.copy2(path, blob_path)
+        elif not os.path.samefile(path, blob_path):
+            # The old path becomes another name for the blob
+            _link(blob_path, path)
+        MediaBlob.objects.get_or_create(name=blob, defaults={"size": size})
+        # Carry over renditions and sidecars so they needn't be regenerated
+        for old, new in zip(_derived(name), _derived(blob)):
+            old_path, new_path = self.storage.path(old), self.storage.path(new)
+            if os.path.exists(old_path) and not os.path.exists(new_path):
+                if not _link(old_path, new_path):
+                    shutil.copy2(old_path, new_path)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from app import media_gc
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete media files no model references (renditions and sidecars follow their source). "
+        "Resumable: with --limit it stops part-way and the next run carries on, so it can run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted; delete nothing.")
+        parser.add_argument("--grace", type=int, help="Keep files younger than this many seconds (default MEDIA_GC_GRACE).")
+        parser.add_argument("--limit", type=int, help="Stop after scanning this many files.")
+        parser.add_argument("--batch-size", type=int, default=media_gc.BATCH_SIZE)
+        parser.add_argument("--restart", action="store_true", help="Start from the top instead of the saved position.")
+
+    def handle(self, *args, **options):
+        stats = media_gc.sweep(
+            dry_run=options["dry_run"],
+            grace=options["grace"],
+            limit=options["limit"],
+            batch_size=options["batch_size"],
+            restart=options["restart"],
+        )
+        verb = "would be deleted" if options["dry_run"] else "deleted"
+        summary = (
+            f"Scanned {stats['scanned']} file(s): {stats['referenced']} referenced, "
+            f"{stats['recent']} within the grace period, {stats['unreferenced']} unreferenced {verb} "
+            f"({stats['bytes']} byte(s) freed)."
+        )
+        if not stats["finished"]:
+            summary += " Stopped at --limit; the next run resumes from there."
+        self.stdout.write(self.style.SUCCESS(summary) if not options["dry_run"] else f"Dry run: {summary}")
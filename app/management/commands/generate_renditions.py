@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from app import renditions
+
+
+class Command(BaseCommand):
+    help = "Generate missing or out-of-date image renditions for every model with an image."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Rebuild renditions even if they are current.")
+
+    def handle(self, *args, **options):
+        sources = written = 0
+        for model in renditions.IMAGE_MODELS:
+            names = model.objects.exclude(image="").exclude(image__isnull=True).values_list("image", flat=True).distinct()
+            for name in names.iterator():
+                sources += 1
+                try:
+                    written += len(renditions.generate(name, force=options["force"]))
+                except (OSError, ValueError, Image.DecompressionBombError) as exc:
+                    self.stderr.write(f"{name}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Checked {sources} image(s), wrote {written} rendition(s)."))
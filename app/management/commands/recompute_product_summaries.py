@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from app import summaries
+from app.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recompute Product summary columns (variant stock/prices, effective price, image counts) in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="*", type=int, help="Only these products (default: all).")
+
+    def handle(self, *args, **options):
+        product_ids = options["product_ids"] or Product.objects.order_by("id").values_list("id", flat=True).iterator()
+        changed = summaries.refresh_products(product_ids)
+        self.stdout.write(self.style.SUCCESS(f"Updated {changed} product(s)."))
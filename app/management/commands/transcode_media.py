@@ -0,0 +1,36 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from app import renditions
+
+SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+
+
+def walk(storage, path=""):
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk(storage, posixpath.join(path, directory))
+
+
+class Command(BaseCommand):
+    help = "Write WebP/AVIF sidecars for every image in the media storage (originals and renditions)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Re-encode sidecars even if they are current.")
+
+    def handle(self, *args, **options):
+        sources = written = 0
+        for name in walk(default_storage):
+            if renditions.is_sidecar(name) or posixpath.splitext(name)[1].lower() not in SOURCE_EXTENSIONS:
+                continue
+            sources += 1
+            try:
+                written += len(renditions.transcode(name, force=options["force"]))
+            except (OSError, ValueError, Image.DecompressionBombError) as exc:
+                self.stderr.write(f"{name}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Checked {sources} image(s), wrote {written} sidecar(s)."))
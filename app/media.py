@@ -0,0 +1,147 @@
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import renditions, storage
+
+CHUNK_SIZE = 64 * 1024
+
+re_range = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def accepted_types(request):
+    """Media types listed explicitly (q > 0) in the Accept header.
+
+    Wildcards don't count: "*/*" doesn't mean a client can decode AVIF.
+    """
+    accepted = set()
+    for part in request.META.get("HTTP_ACCEPT", "").lower().split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type and "*" not in media_type and quality > 0:
+            accepted.add(media_type)
+    return accepted
+
+
+def pick(request, name):
+    """Stored file to send for ``name``: its smallest up-to-date sidecar the client accepts, else itself."""
+    if not default_storage.exists(name):
+        return None
+    accepted = accepted_types(request)
+    source_mtime = None
+    best, best_size = name, default_storage.size(name)
+    for ext, (_, media_type, _) in renditions.SIDECARS.items():
+        sidecar = renditions.sidecar_name(name, ext)
+        if media_type not in accepted or not default_storage.exists(sidecar):
+            continue
+        size = default_storage.size(sidecar)
+        if size >= best_size:
+            continue
+        # Sidecars of an immutable name can't be out of date
+        if not immutable(name):
+            if source_mtime is None:
+                source_mtime = default_storage.get_modified_time(name)
+            if default_storage.get_modified_time(sidecar) < source_mtime:
+                continue
+        best, best_size = sidecar, size
+    return best
+
+
+def immutable(name):
+    """Whether ``name`` can never change content: a blob or a rendition of one."""
+    source = renditions.source_name(name)
+    return storage.is_blob(source[0] if source else name)
+
+
+def byte_range(request, size, etag, last_modified):
+    """(start, end) of the single byte range asked for, None for the whole file, or "unsatisfiable"."""
+    match = re_range.match(request.META.get("HTTP_RANGE", "").replace(" ", ""))
+    if not match or not any(match.groups()):
+        return None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        return None
+    first, last = match.groups()
+    if not first:
+        # "bytes=-500": the last 500 bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return "unsatisfiable"
+    return start, end
+
+
+def _read(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, name):
+    """Send a stored file (see ``pick``), answering conditional and Range requests.
+
+    With MEDIA_ACCEL set the body is left to the front proxy: "x-accel-redirect"
+    (nginx, internal location MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or
+    "x-sendfile" (Apache/lighttpd, absolute path).
+    """
+    served = pick(request, name)
+    if served is None:
+        raise Http404("No such file.")
+    size = default_storage.size(served)
+    mtime = int(default_storage.get_modified_time(served).timestamp())
+    etag = f'"{mtime:x}-{size:x}"'
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        content_type = mimetypes.guess_type(served)[0] or "application/octet-stream"
+        accel = getattr(settings, "MEDIA_ACCEL", None)
+        if accel == "x-accel-redirect":
+            # nginx answers Range itself
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = getattr(settings, "MEDIA_ACCEL_PREFIX", "/protected-media/") + quote(served)
+        elif accel == "x-sendfile":
+            response = HttpResponse(content_type=content_type)
+            response["X-Sendfile"] = default_storage.path(served)
+        else:
+            requested = byte_range(request, size, etag, mtime)
+            if requested == "unsatisfiable":
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+            elif requested is not None:
+                start, end = requested
+                response = StreamingHttpResponse(
+                    _read(default_storage.open(served), start, end - start + 1), status=206, content_type=content_type,
+                )
+                response["Content-Range"] = f"bytes {start}-{end}/{size}"
+                response["Content-Length"] = str(end - start + 1)
+            else:
+                response = FileResponse(default_storage.open(served), content_type=content_type)
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(mtime)
+    if immutable(name):
+        patch_cache_control(response, public=True, max_age=getattr(settings, "MEDIA_IMMUTABLE_MAX_AGE", 31536000), immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, "MEDIA_CACHE_MAX_AGE", 3600))
+    patch_vary_headers(response, ("Accept",))
+    return response
@@ -0,0 +1,159 @@
+import os
+import posixpath
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+
+from . import renditions, storage
+from .models import MediaBlob, MediaSweep
+
+BATCH_SIZE = 500
+
+
+def owner(name):
+    """Name whose references keep ``name`` alive: the source of a rendition or sidecar, else itself."""
+    source = renditions.source_name(name)
+    if source is not None:
+        name = source[0]
+    if renditions.is_sidecar(name):
+        name = posixpath.splitext(name)[0]
+    return name
+
+
+def walk(root, cursor=""):
+    """Names of the files under ``root`` in sorted order, starting after ``cursor``.
+
+    Directories are listed one at a time and skipped wholesale when they
+    sort before the cursor, so memory doesn't grow with the tree.
+    """
+    after = tuple(cursor.split("/")) if cursor else ()
+
+    def visit(directory, parts):
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = parts + (name,)
+            full_path = os.path.join(directory, name)
+            if os.path.isdir(full_path) and not os.path.islink(full_path):
+                if path >= after[:len(path)]:
+                    yield from visit(full_path, path)
+            elif path > after:
+                yield "/".join(path)
+
+    yield from visit(root, ())
+
+
+def referenced(names):
+    """The subset of ``names`` that some model's file field points at."""
+    found = set()
+    for model, fields in storage.file_fields().items():
+        for field in fields:
+            found.update(model._base_manager.filter(**{f"{field}__in": names}).values_list(field, flat=True))
+    return found
+
+
+def linked_blob(root, name):
+    """Blob ``name`` is a hard link to (dedupe_media leaves old paths as such), else None."""
+    if storage.is_blob(name):
+        return None
+    path = os.path.join(root, *name.split("/"))
+    try:
+        if os.stat(path).st_nlink < 2:
+            return None
+        with open(path, "rb") as content:
+            sha = storage.digest(File(content))[0]
+        blob = storage.blob_name(sha, posixpath.splitext(name)[1])
+        return blob if os.path.samefile(path, os.path.join(root, *blob.split("/"))) else None
+    except OSError:
+        return None
+
+
+def _remove(root, path):
+    os.remove(path)
+    # Drop directories the delete left empty (cas/ fans out into many)
+    directory = os.path.dirname(path)
+    while os.path.abspath(directory) != os.path.abspath(root):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def _collect(root, batch, cutoff, dry_run, stats):
+    owners = {name: owner(name) for name in batch}
+    # A legacy upload can look like a sidecar ("photo.v2.webp"); a row naming the file itself keeps it
+    live = referenced(set(batch) | set(owners.values()))
+    # Old URLs (and their renditions) keep working while the blob they link to is referenced
+    aliases = {name: linked_blob(root, name) for name in set(owners.values()) - live}
+    aliases = {name: blob for name, blob in aliases.items() if blob}
+    linked = referenced(set(aliases.values()))
+    live |= {name for name, blob in aliases.items() if blob in linked}
+    # A blob whose refcount moved recently may be mid-way through being (re)used
+    blobs = [name for name in set(owners.values()) - live if storage.is_blob(name)]
+    touched = set(
+        MediaBlob.objects.filter(name__in=blobs, updated_at__gte=datetime.fromtimestamp(cutoff, dt_timezone.utc))
+        .values_list("name", flat=True)
+    )
+    for name in batch:
+        stats["scanned"] += 1
+        if name in live or owners[name] in live:
+            stats["referenced"] += 1
+            continue
+        path = os.path.join(root, *name.split("/"))
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        # Reused blobs get a fresh access time (see ContentAddressedStorage._save)
+        if max(stat.st_mtime, stat.st_atime) >= cutoff or owners[name] in touched:
+            stats["recent"] += 1
+            continue
+        stats["unreferenced"] += 1
+        # A hard-linked file (see dedupe_media) frees nothing until its last link goes
+        if stat.st_nlink == 1:
+            stats["bytes"] += stat.st_size
+        if not dry_run:
+            _remove(root, path)
+            if storage.is_blob(name):
+                MediaBlob.objects.filter(name=name).delete()
+
+
+def sweep(dry_run=False, grace=None, limit=None, batch_size=BATCH_SIZE, restart=False):
+    """Delete media files no model references, ``batch_size`` at a time; returns a Counter of what it saw.
+
+    Files newer than ``grace`` seconds (MEDIA_GC_GRACE) are kept, so an
+    upload whose row isn't committed yet is safe. With ``limit`` the sweep
+    stops after that many files and saves where it got to; the next call
+    carries on from there. A dry run deletes nothing and saves nothing.
+    """
+    if grace is None:
+        grace = getattr(settings, "MEDIA_GC_GRACE", 60 * 60 * 24)
+    root = storages["derived"].location
+    state, _ = MediaSweep.objects.get_or_create(pk=1)
+    cursor = "" if restart else state.cursor
+    cutoff = time.time() - grace
+
+    stats = Counter()
+    names = walk(root, cursor)
+    while True:
+        size = batch_size if not limit else min(batch_size, limit - stats["scanned"])
+        batch = list(islice(names, size))
+        if batch:
+            _collect(root, batch, cutoff, dry_run, stats)
+            cursor = batch[-1]
+        finished = len(batch) < size
+        if not dry_run:
+            state.cursor = "" if finished else cursor
+            state.save(update_fields=["cursor", "updated_at"])
+        if finished or (limit and stats["scanned"] >= limit):
+            break
+    stats["finished"] = int(finished)
+    return stats
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:05
+
+from django.db import migrations
+
+
+def create_product_fts(apps, schema_editor):
+    # FTS5 is SQLite only; other backends fall back to icontains search
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE app_product_fts USING fts5("
+        "name, short_description, description, sku, brand, category, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO app_product_fts (rowid, name, short_description, description, sku, brand, category) "
+        "SELECT p.id, p.name, p.short_description, COALESCE(p.description, ''), COALESCE(p.SKU, ''), "
+        "COALESCE(b.name, ''), c.name "
+        "FROM app_product p "
+        "JOIN app_category c ON c.id = p.category_id "
+        "LEFT JOIN app_brand b ON b.id = p.brand_id"
+    )
+
+
+def drop_product_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS app_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0039_changelog'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_product_fts, drop_product_fts),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0041_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariant',
+            name='combination_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=models.Index(fields=['product', 'combination_key'], name='variant_combination_idx'),
+        ),
+    ]
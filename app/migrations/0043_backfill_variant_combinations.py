@@ -0,0 +1,45 @@
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    """Create VariantOption/VariantValue rows from attributes["options"] and key each variant."""
+    ProductVariant = apps.get_model("app", "ProductVariant")
+    VariantOption = apps.get_model("app", "VariantOption")
+    VariantValue = apps.get_model("app", "VariantValue")
+
+    options, values = {}, {}
+    for value in VariantValue.objects.select_related("option"):
+        options[(value.option.product_id, value.option.name)] = value.option
+        values[(value.option.product_id, value.option.name, value.value)] = value.pk
+    for option in VariantOption.objects.all():
+        options.setdefault((option.product_id, option.name), option)
+
+    for variant in ProductVariant.objects.filter(combination_key="").iterator(chunk_size=500):
+        chosen = (variant.attributes or {}).get("options") or {}
+        if not isinstance(chosen, dict):
+            continue
+        value_ids = set()
+        for name, value in chosen.items():
+            name, value = str(name).strip(), str(value).strip()
+            if not name or not value:
+                continue
+            if (variant.product_id, name) not in options:
+                options[(variant.product_id, name)] = VariantOption.objects.create(product_id=variant.product_id, name=name)
+            if (variant.product_id, name, value) not in values:
+                option = options[(variant.product_id, name)]
+                values[(variant.product_id, name, value)] = VariantValue.objects.create(option=option, value=value).pk
+            value_ids.add(values[(variant.product_id, name, value)])
+        if value_ids:
+            key = "-".join(str(value_id) for value_id in sorted(value_ids))
+            ProductVariant.objects.filter(pk=variant.pk).update(combination_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0042_variant_combination_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
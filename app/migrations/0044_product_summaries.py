@@ -0,0 +1,116 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:40
+
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# Frozen copy of app.summaries as of this migration, so later changes there
+# can't break it against the historical models
+SUMMARY_FIELDS = (
+    "variant_count", "variant_stock", "min_variant_price", "max_variant_price",
+    "effective_price", "gallery_count", "has_image",
+)
+BATCH_SIZE = 500
+
+
+def _price(value):
+    if value in (None, ""):
+        return None
+    try:
+        return Decimal(str(value)).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        return None
+
+
+def backfill(apps, schema_editor):
+    Product = apps.get_model("app", "Product")
+    ProductVariant = apps.get_model("app", "ProductVariant")
+    ProductImage = apps.get_model("app", "ProductImage")
+    product_ids = list(Product.objects.values_list("id", flat=True))
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        variants = defaultdict(list)
+        rows = ProductVariant.objects.filter(product_id__in=batch).values_list("product_id", "price", "stock", "attributes")
+        for product_id, *row in rows:
+            variants[product_id].append(row)
+        galleries = dict(
+            ProductImage.objects.filter(product_id__in=batch).order_by()
+            .values("product_id").annotate(count=Count("id")).values_list("product_id", "count")
+        )
+
+        products = list(Product.objects.filter(pk__in=batch).only("id", "image", "regular_price", "sale_price"))
+        for product in products:
+            rows, gallery_count = variants[product.pk], galleries.get(product.pk, 0)
+            prices = [price for price, _, _ in rows]
+            # A variant's sale price lives in attributes at this point
+            paid = [
+                _price((attributes if isinstance(attributes, dict) else {}).get("sale_price")) or price
+                for price, _, attributes in rows
+            ]
+            product.variant_count = len(rows)
+            product.variant_stock = sum(stock for _, stock, _ in rows)
+            product.min_variant_price = min(prices) if prices else None
+            product.max_variant_price = max(prices) if prices else None
+            if paid:
+                product.effective_price = min(paid)
+            else:
+                product.effective_price = product.sale_price if product.sale_price is not None else product.regular_price
+            product.gallery_count = gallery_count
+            product.has_image = bool(product.image) or gallery_count > 0
+        Product.objects.bulk_update(products, SUMMARY_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0043_backfill_variant_combinations'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_effective_price_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='gallery_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='has_image',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_variant_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_variant_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='variant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='variant_stock',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price'], name='product_effective_price_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
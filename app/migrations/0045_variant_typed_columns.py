@@ -0,0 +1,112 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:41
+
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def _decimal(value):
+    try:
+        value = Decimal(str(value).strip()).quantize(Decimal("0.01"))
+    except (InvalidOperation, ValueError):
+        return None
+    return value if value.is_finite() and abs(value) < 10 ** 8 else None
+
+
+def _points(value):
+    value = _decimal(value)
+    return int(value) if value is not None and value >= 0 else None
+
+
+def copy_attributes(apps, schema_editor):
+    """Copy sale_price/points/description out of attributes, one pk range at a time."""
+    ProductVariant = apps.get_model("app", "ProductVariant")
+    last_pk = 0
+    while True:
+        batch = list(ProductVariant.objects.filter(pk__gt=last_pk).order_by("pk")[:BATCH_SIZE])
+        if not batch:
+            break
+        for variant in batch:
+            attributes = variant.attributes if isinstance(variant.attributes, dict) else {}
+            if attributes.get("sale_price") not in (None, ""):
+                variant.sale_price = _decimal(attributes["sale_price"])
+            if attributes.get("points") not in (None, ""):
+                variant.points = _points(attributes["points"])
+            if attributes.get("description") is not None:
+                variant.description = str(attributes["description"])
+        ProductVariant.objects.bulk_update(batch, ["sale_price", "points", "description"])
+        last_pk = batch[-1].pk
+
+
+def refresh_summaries(apps, schema_editor):
+    """Recompute the product summaries (0044) from the new sale_price column.
+
+    A frozen copy of app.summaries as of this migration, so later changes
+    there can't break it against the historical models.
+    """
+    Product = apps.get_model("app", "Product")
+    ProductVariant = apps.get_model("app", "ProductVariant")
+    ProductImage = apps.get_model("app", "ProductImage")
+    fields = [
+        "variant_count", "variant_stock", "min_variant_price", "max_variant_price",
+        "effective_price", "gallery_count", "has_image",
+    ]
+    product_ids = list(Product.objects.values_list("id", flat=True))
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        variants = defaultdict(list)
+        rows = ProductVariant.objects.filter(product_id__in=batch).values_list("product_id", "price", "sale_price", "stock")
+        for product_id, *row in rows:
+            variants[product_id].append(row)
+        galleries = dict(
+            ProductImage.objects.filter(product_id__in=batch).order_by()
+            .values("product_id").annotate(count=Count("id")).values_list("product_id", "count")
+        )
+
+        products = list(Product.objects.filter(pk__in=batch).only("id", "image", "regular_price", "sale_price"))
+        for product in products:
+            rows, gallery_count = variants[product.pk], galleries.get(product.pk, 0)
+            prices = [price for price, _, _ in rows]
+            paid = [sale_price if sale_price is not None else price for price, sale_price, _ in rows]
+            product.variant_count = len(rows)
+            product.variant_stock = sum(stock for _, _, stock in rows)
+            product.min_variant_price = min(prices) if prices else None
+            product.max_variant_price = max(prices) if prices else None
+            if paid:
+                product.effective_price = min(paid)
+            else:
+                product.effective_price = product.sale_price if product.sale_price is not None else product.regular_price
+            product.gallery_count = gallery_count
+            product.has_image = bool(product.image) or gallery_count > 0
+        Product.objects.bulk_update(products, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0044_product_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariant',
+            name='description',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='points',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='sale_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(copy_attributes, migrations.RunPython.noop),
+        migrations.RunPython(refresh_summaries, migrations.RunPython.noop),
+    ]
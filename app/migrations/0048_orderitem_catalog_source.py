@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0047_orderitem_image_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='source_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.productimage'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='source_product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.product'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='source_variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.productvariant'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+import hashlib
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+# Frozen copy of app.ingest.adopt_catalog_images as of this migration, so
+# later changes there can't break it against the historical models
+BATCH_SIZE = 500
+
+
+def _digest(media, name):
+    try:
+        with media.open(name) as content:
+            sha = hashlib.sha256()
+            for chunk in content.chunks():
+                sha.update(chunk)
+            return sha.hexdigest()
+    except OSError:
+        return None
+
+
+def adopt_catalog_images(apps, schema_editor):
+    """Order item files that duplicate a catalog image become references to it."""
+    OrderItem = apps.get_model("app", "OrderItem")
+    Product = apps.get_model("app", "Product")
+    MediaBlob = apps.get_model("app", "MediaBlob")
+    media = FileSystemStorage()
+
+    catalog = {}
+    sources = (
+        (apps.get_model("app", "ProductVariant"), lambda row: {"source_variant_id": row["pk"], "source_product_id": row["product_id"]}),
+        (apps.get_model("app", "ProductImage"), lambda row: {"source_image_id": row["pk"], "source_product_id": row["product_id"]}),
+        (Product, lambda row: {"source_product_id": row["pk"]}),
+    )
+    for model, fields in sources:
+        columns = ["pk", "image"] + (["product_id"] if model is not Product else [])
+        for row in model.objects.exclude(image="").exclude(image__isnull=True).values(*columns).iterator():
+            digest = _digest(media, row["image"])
+            if digest is not None and digest not in catalog:
+                catalog[digest] = (row["image"], fields(row))
+    if not catalog:
+        return
+
+    moved = Counter()
+    items = OrderItem.objects.exclude(image="").exclude(image__isnull=True).filter(
+        source_product__isnull=True, source_variant__isnull=True, source_image__isnull=True,
+    )
+    batch = []
+    for item in items.only("id", "image").iterator(chunk_size=BATCH_SIZE):
+        match = catalog.get(_digest(media, item.image.name))
+        if match is None or match[0] == item.image.name:
+            continue
+        moved[item.image.name] -= 1
+        moved[match[0]] += 1
+        item.image = match[0]
+        for field, value in match[1].items():
+            setattr(item, field, value)
+        batch.append(item)
+        if len(batch) == BATCH_SIZE:
+            OrderItem.objects.bulk_update(batch, ["image", "source_product", "source_variant", "source_image"])
+            batch = []
+    OrderItem.objects.bulk_update(batch, ["image", "source_product", "source_variant", "source_image"])
+
+    now = timezone.now()
+    for name, delta in moved.items():
+        if delta and name.startswith("cas/"):
+            refcount = F("refcount") + delta if delta > 0 else Greatest(F("refcount") + delta, 0)
+            MediaBlob.objects.filter(name=name).update(refcount=refcount, updated_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0048_orderitem_catalog_source'),
+    ]
+
+    operations = [
+        migrations.RunPython(adopt_catalog_images, migrations.RunPython.noop),
+    ]
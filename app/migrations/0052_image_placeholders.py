@@ -0,0 +1,150 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:03
+
+import base64
+import io
+
+from django.core.files.storage import FileSystemStorage
+from django.db import migrations, models
+from PIL import Image, ImageOps
+
+# Frozen copy of app.placeholders as of this migration, so later changes
+# there can't break it against the historical models
+FIELDS = ("image_width", "image_height", "image_placeholder")
+SIZE = 16
+ORIENTATION = 0x0112
+QUALITY = 40
+BATCH_SIZE = 200
+
+
+def describe(media, name):
+    empty = {"image_width": None, "image_height": None, "image_placeholder": ""}
+    try:
+        with media.open(name) as source:
+            image = Image.open(source)
+            width, height = image.size
+            if image.getexif().get(ORIENTATION) in (5, 6, 7, 8):
+                width, height = height, width
+            image.draft("RGB", (SIZE * 4, SIZE * 4))
+            image.load()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return empty
+
+    thumbnail = ImageOps.exif_transpose(image)
+    thumbnail.thumbnail((SIZE, SIZE))
+    if thumbnail.mode in ("RGBA", "LA", "P", "PA"):
+        thumbnail = thumbnail.convert("RGBA")
+        background = Image.new("RGB", thumbnail.size, "white")
+        background.paste(thumbnail, mask=thumbnail.getchannel("A"))
+        thumbnail = background
+    elif thumbnail.mode != "RGB":
+        thumbnail = thumbnail.convert("RGB")
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, "JPEG", quality=QUALITY, optimize=True)
+    return {
+        "image_width": width,
+        "image_height": height,
+        "image_placeholder": "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode(),
+    }
+
+
+def backfill_placeholders(apps, schema_editor):
+    media = FileSystemStorage()
+    for model_name in ("Product", "Banner", "Ad", "Hero", "Category"):
+        model = apps.get_model("app", model_name)
+        rows = model._base_manager.exclude(image="").exclude(image__isnull=True).filter(image_width__isnull=True)
+        last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk).order_by("pk").only("pk", "image", *FIELDS)[:BATCH_SIZE])
+            if not batch:
+                break
+            for row in batch:
+                for field, value in describe(media, row.image.name).items():
+                    setattr(row, field, value)
+            model._base_manager.bulk_update(batch, FIELDS)
+            last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0051_mediasweep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='banner',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='banner',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='banner',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='hero',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='hero',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='hero',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_placeholders, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import User
 from django.core.validators import validate_email
@@ -9,7 +11,12 @@ class Category(models.Model):
     name = models.CharField(max_length=200, unique=True)
     slug = models.SlugField(max_length=200, unique=True)
     image = models.ImageField(upload_to='category/images/', blank=True, null=True)
+    # Filled in from ``image`` on save (app/placeholders.py)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, default="", editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['name']
@@ -23,6 +30,7 @@ class Brand(models.Model):
     slug = models.SlugField(max_length=200, unique=True)
     image = models.ImageField(upload_to="brands/images/", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['name']
@@ -35,7 +43,12 @@ class Banner(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="banners")
     brand = models.ForeignKey(Brand, on_delete=models.SET_NULL, null=True, blank=True, related_name="banners")
     image = models.ImageField(upload_to="banners/", blank=True, null=True)
+    # Filled in from ``image`` on save (app/placeholders.py)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, default="", editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Banner - {self.category.name}"
@@ -45,7 +58,12 @@ class Ad(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="ads")
     brand = models.ForeignKey(Brand, on_delete=models.SET_NULL, null=True, blank=True, related_name="ads")
     image = models.ImageField(upload_to="ads/", blank=True, null=True)
+    # Filled in from ``image`` on save (app/placeholders.py)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, default="", editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Ad - {self.category.name}"
@@ -55,7 +73,12 @@ class Hero(models.Model):
     title = models.CharField(max_length=200)
     subtext = models.CharField(max_length=200)
     image = models.ImageField(upload_to="heros/", blank=True, null=True)
+    # Filled in from ``image`` on save (app/placeholders.py)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, default="", editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
@@ -81,6 +104,10 @@ class Product(models.Model):
     description = models.TextField(blank=True, null=True)
 
     image = models.ImageField(upload_to="products/main/", null=True, blank=True)  
+    # Filled in from ``image`` on save (app/placeholders.py)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, default="", editable=False)
     regular_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
@@ -92,9 +119,26 @@ class Product(models.Model):
 
     product_type = models.CharField(max_length=20, choices=PRODUCT_TYPE_CHOICES, default="simple")
 
+    # Summaries of variants and images, kept up to date by app/summaries.py
+    variant_count = models.PositiveIntegerField(default=0, editable=False)
+    variant_stock = models.PositiveIntegerField(default=0, editable=False)
+    min_variant_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    max_variant_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    # Lowest price a customer pays: cheapest variant, else sale price, else regular price
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    gallery_count = models.PositiveIntegerField(default=0, editable=False)
+    has_image = models.BooleanField(default=False, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["stock_status"], name="product_stock_status_idx"),
+            models.Index(fields=["product_type"], name="product_type_idx"),
+            models.Index(fields=["effective_price"], name="product_effective_price_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -130,14 +174,85 @@ class ProductVariant(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="variants")
     sku = models.CharField(max_length=100, unique=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     stock = models.PositiveIntegerField(default=0)
+    points = models.PositiveIntegerField(null=True, blank=True)
+    description = models.TextField(blank=True, null=True)
     attributes = models.JSONField(default=dict)
     image = models.ImageField(upload_to="products/variants/", null=True, blank=True)
+    # Sorted VariantValue ids, e.g. "4-9" (see app/variants.py)
+    combination_key = models.CharField(max_length=255, blank=True, default="", editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "combination_key"], name="variant_combination_idx"),
+        ]
 
     def __str__(self):
         return f"Variant {self.sku} - {self.product.name}"
 
 
+# Where the media garbage collector left off (see app/media_gc.py)
+class MediaSweep(models.Model):
+    cursor = models.CharField(max_length=1024, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.cursor or "(start)"
+
+
+# Resumable admin gallery upload in progress (see app/uploads.py)
+class GalleryUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+# Catalog change log (feeds /api/products/?since= delta sync)
+class ChangeLog(models.Model):
+    PRODUCT = "product"
+    VARIANT = "variant"
+    MODEL_CHOICES = [
+        (PRODUCT, "Product"),
+        (VARIANT, "Product Variant"),
+    ]
+    UPSERT = "upsert"
+    DELETE = "delete"
+    ACTION_CHOICES = [
+        (UPSERT, "Created / Updated"),
+        (DELETE, "Deleted"),
+    ]
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.action} {self.model} #{self.object_id}"
+
+
+# Content-addressed media blobs (see app/storage.py)
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    # Rows whose file fields point at this blob
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
 # User Login System 
 
 # class CustomUser(AbstractUser):
@@ -199,12 +314,14 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending") 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @staticmethod
+    def type_for(prices):
+                """"redeem" when there are items and every one is free, else "normal"."""
+                prices = list(prices)
+                return "redeem" if prices and all(price == 0 for price in prices) else "normal"
+
     def update_order_type(self):
-                items = self.items.all()
-                if items.exists() and all(item.price == 0 for item in items):
-                    self.type = "redeem"
-                else:
-                    self.type = "normal"
+                self.type = self.type_for(item.price for item in self.items.all())
                 self.save()
 
     def __str__(self):
@@ -213,6 +330,12 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name="items", on_delete=models.CASCADE)
     image = models.ImageField(upload_to="order_items/", null=True, blank=True)
+    # Remote image the client sent; attached to ``image`` in the background (app/ingest.py)
+    image_url = models.URLField(max_length=1000, blank=True, default="")
+    # Catalog row whose image ``image`` shares, if it came from the catalog
+    source_product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    source_variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    source_image = models.ForeignKey(ProductImage, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
     name = models.CharField(max_length=255)
     pts = models.IntegerField()
     variants = models.CharField(max_length=255, null=True, blank=True)
@@ -221,6 +344,7 @@ class OrderItem(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        # New orders go through orders.create, which bulk inserts and sets the type once
         self.order.update_order_type()
 
 class Payment(models.Model):
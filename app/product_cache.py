@@ -0,0 +1,119 @@
+import hashlib
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
+from rest_framework.response import Response
+
+from . import snapshots, variants
+from .models import Product, ProductVariant, VariantOption, VariantValue
+from .serializers import ProductSerializer, ProductVariantSerializer, VariantOptionSerializer
+
+# Per-product API documents, encoded and cached like the catalog snapshots.
+# Each product has its own version key; category/brand edits bump a shared one
+# because every product embeds their names.
+SHARED_VERSION_KEY = "product:version"
+SLUGS_VERSION_KEY = "product:slugs:version"
+
+
+def _product_version_key(product_id):
+    return f"product:{product_id}:version"
+
+
+def _versions(*keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return ":".join(versions[key] for key in keys)
+
+
+def _require_product(product_id):
+    if not Product.objects.filter(pk=product_id).exists():
+        raise Http404("No Product matches the given query.")
+
+
+def build_detail(request, product_id):
+    queryset = ProductSerializer.optimize_queryset(Product.objects.filter(pk=product_id), request.query_params)
+    product = queryset.first()
+    if product is None:
+        raise Http404("No Product matches the given query.")
+    return ProductSerializer(product, context={"request": request}).data
+
+
+def build_variants(request, product_id):
+    _require_product(product_id)
+    variants = ProductVariant.objects.filter(product_id=product_id).order_by("id")
+    return ProductVariantSerializer(variants, many=True, context={"request": request}).data
+
+
+def build_options(request, product_id):
+    _require_product(product_id)
+    options = (
+        VariantOption.objects.filter(product_id=product_id)
+        .prefetch_related(Prefetch("values", queryset=VariantValue.objects.order_by("id")))
+        .order_by("id")
+    )
+    return VariantOptionSerializer(options, many=True).data
+
+
+# part -> (builder, query params that change the payload)
+PARTS = {
+    "detail": (build_detail, ("fields", "expand")),
+    "variants": (build_variants, ()),
+    "options": (build_options, ()),
+    "resolve": (variants.build_resolve, ("values",)),
+}
+
+
+def resolve(lookup):
+    """Product id for an id or slug; all-digit lookups are ids."""
+    if lookup.isdigit():
+        return int(lookup)
+    key = f"product:slug:{_versions(SLUGS_VERSION_KEY)}:{lookup}"
+    product_id = cache.get(key)
+    if product_id is None:
+        product_id = Product.objects.filter(slug=lookup).values_list("id", flat=True).first()
+        if product_id is None:
+            raise Http404("No Product matches the given query.")
+        cache.set(key, product_id, getattr(settings, "CATALOG_SNAPSHOT_TIMEOUT", 300))
+    return product_id
+
+
+def serve(request, part, lookup):
+    build, params = PARTS[part]
+    product_id = resolve(lookup)
+    # Browsable API and other renderers still go through DRF
+    if request.accepted_renderer.format != "json":
+        return Response(build(request, product_id))
+
+    query = urlencode([(name, request.query_params[name]) for name in params if name in request.query_params])
+    origin = snapshots.request_origin(request)
+    versions = _versions(SHARED_VERSION_KEY, _product_version_key(product_id))
+    key = f"product:{product_id}:{part}:{versions}:" + hashlib.md5(f"{origin}?{query}".encode()).hexdigest()
+    document = cache.get(key)
+    if document is None:
+        document = snapshots.encode(build(snapshots.SnapshotRequest(origin, request.path, query), product_id))
+        cache.set(key, document, getattr(settings, "CATALOG_SNAPSHOT_TIMEOUT", 300))
+    return snapshots.respond(request, document)
+
+
+# Versions move once the change commits: bumped earlier, a request made
+# meanwhile would cache the old rows under the new version
+
+def invalidate(*product_ids):
+    versions = {_product_version_key(product_id): uuid.uuid4().hex for product_id in product_ids}
+    transaction.on_commit(lambda: cache.set_many(versions, None))
+
+
+def invalidate_all():
+    transaction.on_commit(lambda: cache.set(SHARED_VERSION_KEY, uuid.uuid4().hex, None))
+
+
+def invalidate_slugs():
+    transaction.on_commit(lambda: cache.set(SLUGS_VERSION_KEY, uuid.uuid4().hex, None))
@@ -0,0 +1,158 @@
+import io
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from PIL import Image, ImageOps, features
+
+from . import storage
+from .models import Ad, AppUser, Banner, Brand, Category, Hero, Product, ProductImage, ProductVariant
+
+# Renditions are stored as "renditions/<width>/<source name>" in the media
+# storage, so the source of any rendition is known from its name.
+PREFIX = "renditions"
+
+# Output format per source extension; anything else gets no renditions
+FORMATS = {
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".png": "PNG",
+    ".webp": "WEBP",
+}
+QUALITY = 82
+
+# Modern encodings stored beside an image (original or rendition) as
+# "<name>.<ext>"; media.py serves the smallest one the client accepts.
+SIDECARS = {
+    "avif": ("AVIF", "image/avif", 60),
+    "webp": ("WEBP", "image/webp", 80),
+}
+
+# Models whose ``image`` gets renditions
+IMAGE_MODELS = (Category, Brand, Banner, Ad, Hero, Product, ProductImage, ProductVariant, AppUser)
+
+
+def widths():
+    return tuple(getattr(settings, "IMAGE_RENDITION_WIDTHS", (160, 480, 1080)))
+
+
+def supported(name):
+    return bool(name) and posixpath.splitext(name)[1].lower() in FORMATS
+
+
+def rendition_name(name, width):
+    return f"{PREFIX}/{width}/{name}"
+
+
+def source_name(name):
+    """(source name, width) for a rendition name, or None if it isn't one."""
+    parts = name.split("/", 2)
+    if len(parts) != 3 or parts[0] != PREFIX or not parts[1].isdigit():
+        return None
+    return parts[2], int(parts[1])
+
+
+def sidecar_formats():
+    """Sidecar extensions to write: IMAGE_SIDECAR_FORMATS that this Pillow can encode."""
+    wanted = getattr(settings, "IMAGE_SIDECAR_FORMATS", ("webp", "avif"))
+    return [ext for ext in wanted if ext in SIDECARS and features.check(ext)]
+
+
+def sidecar_name(name, ext):
+    return f"{name}.{ext}"
+
+
+def is_sidecar(name):
+    """Whether ``name`` looks like "<image name>.<sidecar ext>"."""
+    stem, ext = posixpath.splitext(name)
+    return ext.lstrip(".") in SIDECARS and posixpath.splitext(stem)[1] != ""
+
+
+def srcset(name):
+    """{width: rendition name} for an image name, or None when it has none."""
+    if not supported(name):
+        return None
+    return {str(width): rendition_name(name, width) for width in widths()}
+
+
+def _source_mtime(name):
+    # A blob's content never changes, so whatever was derived from it is current
+    return None if storage.is_blob(name) else default_storage.get_modified_time(name)
+
+
+def _stale(target, source_mtime):
+    if not default_storage.exists(target):
+        return True
+    return source_mtime is not None and default_storage.get_modified_time(target) < source_mtime
+
+
+def _encode(image, fmt, quality):
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    elif fmt != "JPEG" and image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if image.mode in ("LA", "PA", "P") else "RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _open(name):
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def _write(name, content):
+    # Uploads are content-addressed; derived files keep the name they're given
+    derived = storages["derived"]
+    if derived.exists(name):
+        derived.delete(name)
+    return derived.save(name, ContentFile(content))
+
+
+def transcode(name, force=False):
+    """Write the missing or out-of-date sidecars (WebP/AVIF) of a stored image; returns the names written."""
+    if not default_storage.exists(name):
+        return []
+    source_mtime = _source_mtime(name)
+    extension = posixpath.splitext(name)[1].lower().lstrip(".")
+    targets = [ext for ext in sidecar_formats() if ext != extension]
+    targets = [ext for ext in targets if force or _stale(sidecar_name(name, ext), source_mtime)]
+    if not targets:
+        return []
+    image = _open(name)
+    written = []
+    for ext in targets:
+        fmt, _, quality = SIDECARS[ext]
+        written.append(_write(sidecar_name(name, ext), _encode(image, fmt, quality)))
+    return written
+
+
+def generate(name, force=False, sidecars=True):
+    """Write the missing or out-of-date renditions of ``name``; returns the names written.
+
+    Anything is rebuilt only when it is older than its source, so this is
+    cheap to call again for an unchanged image. With ``sidecars`` the
+    original and every rendition are also transcoded (see ``transcode``).
+    """
+    if not supported(name) or not default_storage.exists(name):
+        return []
+    source_mtime = _source_mtime(name)
+    targets = [(width, rendition_name(name, width)) for width in widths()]
+    stale = [(width, target) for width, target in targets if force or _stale(target, source_mtime)]
+
+    written = []
+    if stale:
+        fmt = FORMATS[posixpath.splitext(name)[1].lower()]
+        image = _open(name)
+        for width, target in stale:
+            resized = image
+            if image.width > width:
+                resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            written.append(_write(target, _encode(resized, fmt, QUALITY)))
+    if sidecars:
+        for target in [name] + [target for _, target in targets]:
+            written += transcode(target, force=force)
+    return written
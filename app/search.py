@@ -0,0 +1,115 @@
+import re
+
+from django.db import connection
+
+from .models import Product
+
+FTS_TABLE = "app_product_fts"
+
+# bm25 column weights: name, short_description, description, sku, brand, category
+BM25_WEIGHTS = (10.0, 2.0, 1.0, 5.0, 3.0, 3.0)
+
+_INDEX_SELECT = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, short_description, description, sku, brand, category)
+    SELECT p.id, p.name, p.short_description, COALESCE(p.description, ''), COALESCE(p.SKU, ''),
+           COALESCE(b.name, ''), c.name
+    FROM app_product p
+    JOIN app_category c ON c.id = p.category_id
+    LEFT JOIN app_brand b ON b.id = p.brand_id
+"""
+
+
+def fts_enabled():
+    return connection.vendor == "sqlite"
+
+
+def query_terms(query):
+    return re.findall(r"\w+", query or "")
+
+
+def match_expression(terms):
+    """FTS5 query requiring every term, each as a prefix."""
+    return " ".join('"%s"*' % term.replace('"', '""') for term in terms)
+
+
+def index_products(product_ids):
+    product_ids = list(product_ids)
+    if not fts_enabled() or not product_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+        cursor.execute(f"{_INDEX_SELECT} WHERE p.id IN ({placeholders})", product_ids)
+
+
+def unindex_product(product_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
+
+
+def rebuild_index():
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(_INDEX_SELECT)
+
+
+class RankedProductIds:
+    """Lazy, sliceable sequence of product ids for a query, best match first.
+
+    Pagination only ever asks for ``count()`` and one slice, so each page is a
+    COUNT plus a LIMIT/OFFSET against the index.
+    """
+
+    def __init__(self, query):
+        self.terms = query_terms(query)
+        self.match = match_expression(self.terms)
+
+    def count(self):
+        if not self.match:
+            return 0
+        if not fts_enabled():
+            return self._fallback().count()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [self.match])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop = item.start or 0, item.stop
+        else:
+            start, stop = item, item + 1
+        limit = -1 if stop is None else max(stop - start, 0)
+        if not self.match:
+            ids = []
+        elif not fts_enabled():
+            ids = list(self._fallback().values_list("id", flat=True)[start:stop])
+        else:
+            weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                    f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s",
+                    [self.match, limit, start],
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+        return ids if isinstance(item, slice) else ids[0]
+
+    def _fallback(self):
+        products = Product.objects.all()
+        for term in self.terms:
+            products = products.filter(name__icontains=term)
+        return products.order_by("-id")
+
+
+def search_products(query, queryset=None, limit=None):
+    """Products matching ``query`` in rank order."""
+    ids = RankedProductIds(query)[:limit]
+    products = (queryset if queryset is not None else Product.objects.all()).in_bulk(ids)
+    return [products[product_id] for product_id in ids if product_id in products]
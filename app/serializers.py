@@ -1,55 +1,195 @@
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
+from django.core.files.storage import default_storage
 from django.db.models import Sum
 import ast
-from .models import Category, Brand, Product, Discount, Redeem, Banner, Hero, Ad, ProductImage, ProductVariant, Order, OrderItem, Payment, AppUser, Address
+from . import renditions
+from .models import Category, Brand, Product, Discount, Redeem, Banner, Hero, Ad, ProductImage, ProductVariant, VariantOption, VariantValue, Order, OrderItem, Payment, AppUser, Address
+
+def _param_list(params, name):
+    return [value.strip() for value in (params.get(name) or "").split(",") if value.strip()]
+
+
+class SrcsetField(serializers.ReadOnlyField):
+    """``{"160": url, "480": url, ...}`` for an image's renditions, or None."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("source", "image")
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        names = renditions.srcset(value.name if value else None)
+        if names is None:
+            return None
+        request = self.context.get("request")
+        urls = {width: default_storage.url(name) for width, name in names.items()}
+        if request is not None:
+            return {width: request.build_absolute_uri(url) for width, url in urls.items()}
+        return urls
+
+
+class SparseFieldsMixin:
+    """Let clients pick fields with ``?fields=id,name`` and embedded relations with ``?expand=``.
+
+    Without either param the serializer is unchanged. With ``fields``, only
+    the listed fields plus any ``expand``-ed relations are rendered. Once
+    ``expand`` is given (even empty), the ``expandable`` relations it doesn't
+    name are collapsed: to-one relations render as their id, to-many ones
+    are left out. ``optimize_queryset`` skips loading everything not
+    rendered. The params are read from ``context["query_params"]`` or the
+    context request.
+    """
+
+    # field -> ("select" | "prefetch", lookup) needed to render it
+    related_loading = {}
+    # embedded relation -> (key, id attname) rendered when collapsed, or None to leave it out
+    expandable = {}
+
+    @staticmethod
+    def requested_fields(params):
+        fields = _param_list(params, "fields")
+        if not fields:
+            return None
+        return set(fields) | set(_param_list(params, "expand"))
+
+    @classmethod
+    def collapsed(cls, params):
+        """Expandable relations not embedded: none unless ``expand`` is given."""
+        if "expand" not in params:
+            return set()
+        return set(cls.expandable) - set(_param_list(params, "expand"))
+
+    @classmethod
+    def is_customized(cls, params):
+        return cls.requested_fields(params) is not None or bool(cls.collapsed(params))
+
+    @classmethod
+    def optimize_queryset(cls, queryset, params):
+        requested = cls.requested_fields(params)
+        collapsed = cls.collapsed(params)
+        select, prefetch = [], []
+        for name, (kind, lookup) in cls.related_loading.items():
+            if name not in collapsed and (requested is None or name in requested):
+                (select if kind == "select" else prefetch).append(lookup)
+        queryset = queryset.select_related(*select).prefetch_related(*prefetch)
+        if requested is not None:
+            model_fields = {field.name for field in queryset.model._meta.concrete_fields if not field.is_relation}
+            # Declared fields may read another attribute (image_srcset reads image)
+            sources = {field.source for name, field in cls._declared_fields.items() if name in requested and field.source}
+            deferred = (set(cls.Meta.fields) & model_fields) - requested - sources - {"id"}
+            queryset = queryset.defer(*deferred)
+        return queryset
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        params = self.context.get("query_params")
+        if params is None and self.context.get("request") is not None:
+            params = self.context["request"].query_params
+        if params is None:
+            return
+        requested = self.requested_fields(params)
+        ids = {}
+        for name in self.collapsed(params):
+            self.fields.pop(name, None)
+            target = self.expandable[name]
+            if target is not None and (requested is None or name in requested or target[0] in requested):
+                ids[target[0]] = target[1]
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+        for key, attname in ids.items():
+            self.fields[key] = serializers.ReadOnlyField(source=attname)
+
 
 class CategorySerializer(serializers.ModelSerializer):
+    image_srcset = SrcsetField()
+
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'image', 'created_at']
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'image_width', 'image_height', 'image_placeholder', 'created_at']
 
 
 class BrandSerializer(serializers.ModelSerializer):
+    image_srcset = SrcsetField()
+
     class Meta:
         model = Brand
-        fields = ['id', 'name', 'slug', 'image', 'created_at']      
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'created_at']      
 
 
 class BannerSerializer(serializers.ModelSerializer):
     category = serializers.StringRelatedField()   
     brand = serializers.StringRelatedField() 
+    image_srcset = SrcsetField()
+
     class Meta:
         model = Banner
-        fields = ["id", "category", "brand", "image", "created_at"]   
+        fields = ["id", "category", "brand", "image", "image_srcset", "image_width", "image_height", "image_placeholder", "created_at"]   
 
 
 class AdSerializer(serializers.ModelSerializer):
     category = serializers.StringRelatedField()   
     brand = serializers.StringRelatedField() 
+    image_srcset = SrcsetField()
+
     class Meta:
         model = Ad
-        fields = ["id", "category", "brand", "image", "created_at"] 
+        fields = ["id", "category", "brand", "image", "image_srcset", "image_width", "image_height", "image_placeholder", "created_at"] 
 
 
 class HeroSerializer(serializers.ModelSerializer):
+    image_srcset = SrcsetField()
+
     class Meta:
         model = Hero
-        fields = ['id', 'title', 'subtext', 'image', 'created_at']          
+        fields = ['id', 'title', 'subtext', 'image', 'image_srcset', 'image_width', 'image_height', 'image_placeholder', 'created_at']          
 
 
 
+def legacy_variant_attributes(attributes, sale_price, points, description):
+    """``attributes`` with the keys that used to be stored in it, as the strings older clients read."""
+    attributes = dict(attributes or {})
+    for key, value in (("sale_price", sale_price), ("points", points), ("description", description)):
+        attributes[key] = None if value is None else str(value)
+    return attributes
+
+
 class ProductVariantSerializer(serializers.ModelSerializer):
+    attributes = serializers.SerializerMethodField()
+    image_srcset = SrcsetField()
+
     class Meta:
         model = ProductVariant
-        fields = ["id", "sku", "price", "stock", "attributes", "image"]
+        fields = [
+            "id", "sku", "price", "sale_price", "stock", "points", "description",
+            "attributes", "combination_key", "image", "image_srcset",
+        ]
+
+    def get_attributes(self, obj):
+        return legacy_variant_attributes(obj.attributes, obj.sale_price, obj.points, obj.description)
 
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    image_srcset = SrcsetField()
+
     class Meta:
         model = ProductImage
-        fields = ["id", "image"]
+        fields = ["id", "image", "image_srcset"]
+
+
+class VariantValueSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VariantValue
+        fields = ["id", "value"]
+
+
+class VariantOptionSerializer(serializers.ModelSerializer):
+    values = VariantValueSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = VariantOption
+        fields = ["id", "name", "values"]
 
 
 class RedeemSerializer(serializers.ModelSerializer):
@@ -67,11 +207,20 @@ class RedeemSerializer(serializers.ModelSerializer):
         ]
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = serializers.StringRelatedField()
     brand = serializers.StringRelatedField()
     gallery_images = ProductImageSerializer(many=True, read_only=True)
     variants = ProductVariantSerializer(many=True, read_only=True)
+    image_srcset = SrcsetField()
+
+    related_loading = {
+        "category": ("select", "category"),
+        "brand": ("select", "brand"),
+        "gallery_images": ("prefetch", "gallery_images"),
+        "variants": ("prefetch", "variants"),
+    }
+    expandable = {"gallery_images": None, "variants": None}
 
     class Meta:
         model = Product
@@ -82,6 +231,10 @@ class ProductSerializer(serializers.ModelSerializer):
             "short_description",
             "description",
             "image",
+            "image_srcset",
+            "image_width",
+            "image_height",
+            "image_placeholder",
             "regular_price",
             "sale_price",
             "SKU",
@@ -89,6 +242,13 @@ class ProductSerializer(serializers.ModelSerializer):
             "stock_status",
             "points",
             "product_type",
+            "variant_count",
+            "variant_stock",
+            "min_variant_price",
+            "max_variant_price",
+            "effective_price",
+            "gallery_count",
+            "has_image",
             "category",
             "brand",
             "gallery_images",
@@ -116,15 +276,21 @@ class AddressSerializer(serializers.ModelSerializer):
 
 
 
-class AppUserSerializer(serializers.ModelSerializer):
+class AppUserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=6, required=True)
     password_hash = serializers.CharField(read_only=True)
     total_points = serializers.SerializerMethodField()
     addresses = AddressSerializer(many=True, required=False) 
+    image_srcset = SrcsetField()
+
+    related_loading = {
+        "addresses": ("prefetch", "addresses"),
+    }
+    expandable = {"addresses": None}
 
     class Meta:
         model = AppUser
-        fields = ["id", "number", "name", "email", "image", "password", "password_hash",
+        fields = ["id", "number", "name", "email", "image", "image_srcset", "password", "password_hash",
                   "created_at", "api_token", "total_points", "addresses"]
         read_only_fields = ["id", "created_at", "password_hash", "api_token", "total_points"]
 
@@ -182,13 +348,20 @@ class AppUserSerializer(serializers.ModelSerializer):
 #         model = AppUser
 #         fields = ['id', 'number', 'name', 'email'] 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_detail = AppUserSerializer(source="user", read_only=True)
     items = OrderItemSerializer(many=True, read_only=True)
     payments = PaymentSerializer(many=True, read_only=True)
     address = serializers.SerializerMethodField()
     shipping = serializers.SerializerMethodField()
 
+    related_loading = {
+        "user_detail": ("prefetch", "user__addresses"),
+        "items": ("prefetch", "items"),
+        "payments": ("prefetch", "payments"),
+    }
+    expandable = {"user_detail": ("user", "user_id"), "items": None, "payments": None}
+
     class Meta:
         model = Order
         fields = [ 'id', 'user_detail', 'address', 'shipping', 'status', 'type', 'items', 'payments',
@@ -0,0 +1,194 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import ingest, placeholders, product_cache, renditions, search, snapshots, storage, summaries, sync
+from .tasks import run_in_background
+from .models import ChangeLog, Product, ProductVariant, ProductImage, VariantOption, VariantValue, Category, Brand
+
+
+# Receivers run in the order they are connected. The ones that write derived
+# columns with update()/bulk_update() (no signals of their own) come first, so
+# the caches below are invalidated after those writes, not before.
+
+# Product summary columns
+@receiver(post_save, sender=Product)
+def refresh_product_summary(sender, instance, **kwargs):
+    summaries.refresh_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def refresh_parent_summary(sender, instance, **kwargs):
+    summaries.refresh_products([instance.product_id])
+
+
+# Image dimensions and placeholders
+def refresh_placeholder(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    name = instance.image.name if instance.image else ""
+    if name:
+        stale = name not in getattr(instance, "_stored_files", []) or instance.image_width is None
+    else:
+        stale = instance.image_width is not None or bool(instance.image_placeholder)
+    if stale:
+        placeholders.refresh(instance)
+
+
+for model in placeholders.MODELS:
+    post_save.connect(refresh_placeholder, sender=model, dispatch_uid=f"placeholders-{model.__name__}")
+
+
+# Catalog snapshots
+def invalidate_snapshots(sender, **kwargs):
+    snapshots.invalidate(*snapshots.DEPENDENCIES[sender])
+
+
+for model in snapshots.DEPENDENCIES:
+    post_save.connect(invalidate_snapshots, sender=model, dispatch_uid=f"snapshots-save-{model.__name__}")
+    post_delete.connect(invalidate_snapshots, sender=model, dispatch_uid=f"snapshots-delete-{model.__name__}")
+
+
+# Image renditions
+def generate_renditions(sender, instance, **kwargs):
+    if instance.image:
+        run_in_background(renditions.generate, instance.image.name)
+
+
+for model in renditions.IMAGE_MODELS:
+    post_save.connect(generate_renditions, sender=model, dispatch_uid=f"renditions-{model.__name__}")
+
+
+# Media blob reference counts
+def remember_stored_files(sender, instance, raw=False, **kwargs):
+    instance._stored_files = storage.saved_names(sender, instance.pk) if instance.pk and not raw else []
+
+
+def count_stored_files(sender, instance, raw=False, **kwargs):
+    if not raw:
+        storage.track(getattr(instance, "_stored_files", []), storage.stored_names(instance))
+
+
+def release_stored_files(sender, instance, **kwargs):
+    storage.track(storage.stored_names(instance), [])
+
+
+for model in storage.file_fields():
+    pre_save.connect(remember_stored_files, sender=model, dispatch_uid=f"blobs-pre-save-{model.__name__}")
+    post_save.connect(count_stored_files, sender=model, dispatch_uid=f"blobs-save-{model.__name__}")
+    post_delete.connect(release_stored_files, sender=model, dispatch_uid=f"blobs-delete-{model.__name__}")
+
+
+# Order items keep catalog images that are replaced or deleted
+def keep_replaced_images(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ingest.materialize(set(getattr(instance, "_stored_files", [])) - set(storage.stored_names(instance)))
+
+
+def keep_deleted_images(sender, instance, **kwargs):
+    ingest.materialize(storage.stored_names(instance))
+
+
+for model in ingest.CATALOG_IMAGE_MODELS:
+    post_save.connect(keep_replaced_images, sender=model, dispatch_uid=f"order-images-save-{model.__name__}")
+    post_delete.connect(keep_deleted_images, sender=model, dispatch_uid=f"order-images-delete-{model.__name__}")
+
+
+# Per-product documents
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_document(sender, instance, **kwargs):
+    product_cache.invalidate(instance.pk)
+    # The slug may have changed or been freed
+    product_cache.invalidate_slugs()
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=VariantOption)
+@receiver(post_delete, sender=VariantOption)
+def invalidate_product_child_document(sender, instance, **kwargs):
+    product_cache.invalidate(instance.product_id)
+
+
+@receiver(post_save, sender=VariantValue)
+@receiver(post_delete, sender=VariantValue)
+def invalidate_variant_value_document(sender, instance, **kwargs):
+    product_id = VariantOption.objects.filter(pk=instance.option_id).values_list("product_id", flat=True).first()
+    if product_id is not None:
+        product_cache.invalidate(product_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_grouping_documents(sender, instance, created=False, **kwargs):
+    if not created:
+        product_cache.invalidate_all()
+
+
+# Delta sync change log
+@receiver(post_save, sender=Product)
+def log_product_saved(sender, instance, **kwargs):
+    sync.record_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def log_product_deleted(sender, instance, **kwargs):
+    sync.record_products([instance.pk], action=ChangeLog.DELETE)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def log_product_child_changed(sender, instance, **kwargs):
+    sync.record_products([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductVariant)
+def log_variant_deleted(sender, instance, **kwargs):
+    sync.record_variant_deleted(instance.pk)
+    sync.record_products([instance.product_id])
+
+
+# Products embed their category/brand name
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(pre_delete, sender=Brand)
+def log_grouping_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    lookup = "category" if sender is Category else "brand"
+    sync.record_products(Product.objects.filter(**{lookup: instance}).values_list("id", flat=True))
+
+
+# Product full-text index
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.unindex_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def reindex_grouping(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    lookup = "category" if sender is Category else "brand"
+    search.index_products(Product.objects.filter(**{lookup: instance}).values_list("id", flat=True))
+
+
+@receiver(pre_delete, sender=Brand)
+def reindex_brand_products(sender, instance, **kwargs):
+    # Products keep existing with brand=NULL; refresh their rows once that is committed
+    product_ids = list(instance.products.values_list("id", flat=True))
+    transaction.on_commit(lambda: search.index_products(product_ids))
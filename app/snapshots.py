@@ -0,0 +1,250 @@
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from urllib.parse import urlencode, urljoin
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, QueryDict
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+
+from . import compression, facets, fastpath, renderers, sync
+from .models import Product, ProductImage, ProductVariant, Category, Brand, Banner, Ad, Hero, Redeem
+from .pagination import ProductCursorPagination
+from .serializers import BannerSerializer, AdSerializer, ProductSerializer
+from .tasks import run_in_background
+
+
+# (origin, path) pairs each section has been served for, most recent last, so
+# background rebuilds know which URLs to warm. Capped: the Host header varies.
+SEEN_LIMIT = 32
+_seen = defaultdict(OrderedDict)
+_seen_lock = threading.Lock()
+
+
+class SnapshotRequest:
+    """Minimal request stand-in so snapshots can be built outside a request."""
+
+    def __init__(self, origin, path, query=""):
+        self.origin = origin
+        self.path = path
+        self.query_params = QueryDict(query)
+
+    def build_absolute_uri(self, location=None):
+        if location is None:
+            location = self.path
+            if self.query_params:
+                location += "?" + self.query_params.urlencode()
+        return urljoin(self.origin, location)
+
+
+def build_categories(request):
+    categories = Category.objects.all().order_by('-id')
+    return fastpath.serialize_queryset(categories, fastpath.CATEGORY_FIELDS, request)
+
+
+def build_brands(request):
+    brands = Brand.objects.all().order_by('-id')
+    return fastpath.serialize_queryset(brands, fastpath.BRAND_FIELDS, request)
+
+
+def build_banners(request):
+    banners = Banner.objects.select_related("category", "brand").order_by('-id')
+    return BannerSerializer(banners, many=True, context={'request': request}).data
+
+
+def build_ads(request):
+    ads = Ad.objects.select_related("category", "brand").order_by('-id')
+    return AdSerializer(ads, many=True, context={'request': request}).data
+
+
+def build_heros(request):
+    heros = Hero.objects.all().order_by('-id')
+    return fastpath.serialize_queryset(heros, fastpath.HERO_FIELDS, request)
+
+
+def build_redeems(request):
+    redeems = Redeem.objects.all().order_by('-id')
+    return fastpath.serialize_queryset(redeems, fastpath.REDEEM_FIELDS, request)
+
+
+def build_products(request):
+    # Taken before reading the page so nothing changed meanwhile is skipped by the next delta
+    sync_token = sync.current_token()
+    products = facets.filter_products(Product.objects.all(), request.query_params)
+    paginator = ProductCursorPagination()
+    if not ProductSerializer.is_customized(request.query_params):
+        page = paginator.paginate_queryset(products.values(*fastpath.columns(fastpath.PRODUCT_FIELDS)), request)
+        results = fastpath.serialize_products(page, request)
+    else:
+        page = paginator.paginate_queryset(ProductSerializer.optimize_queryset(products, request.query_params), request)
+        results = ProductSerializer(page, many=True, context={'request': request}).data
+    data = paginator.get_paginated_response(results).data
+    data["sync_token"] = sync_token
+    # Facet counts only come with the first page of a listing
+    if not request.query_params.get(paginator.cursor_query_param):
+        data["facets"] = facets.product_facets(products)
+    return data
+
+
+# section -> (builder, query params that change the payload)
+SECTIONS = {
+    "categories": (build_categories, ()),
+    "brands": (build_brands, ()),
+    "banners": (build_banners, ()),
+    "ads": (build_ads, ()),
+    "heros": (build_heros, ()),
+    "redeems": (build_redeems, ()),
+    "products": (build_products, ("cursor", "page_size", "since", "fields", "expand") + facets.FILTER_PARAMS),
+}
+
+# Sections bundled into /api/home/
+HOME_SECTIONS = ("categories", "brands", "banners", "ads", "heros", "redeems")
+
+# model -> sections whose payload embeds its rows
+DEPENDENCIES = {
+    Product: ("products",),
+    ProductVariant: ("products",),
+    ProductImage: ("products",),
+    Category: ("categories", "products", "banners", "ads"),
+    Brand: ("brands", "products", "banners", "ads"),
+    Banner: ("banners",),
+    Ad: ("ads",),
+    Hero: ("heros",),
+    Redeem: ("redeems",),
+}
+
+
+def _version_key(section):
+    return f"snapshot:{section}:version"
+
+
+def _version(section):
+    version = cache.get(_version_key(section))
+    if version is None:
+        cache.add(_version_key(section), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(section))
+    return version
+
+
+def _changed_key(section):
+    return f"snapshot:{section}:changed"
+
+
+def last_changed(section):
+    """When ``section`` was last invalidated; unknown (first call, or expired) counts as now.
+
+    Expires like the snapshots, so a worker whose cache missed another
+    worker's change catches up at the same time as its snapshots do.
+    """
+    changed = cache.get(_changed_key(section))
+    if changed is None:
+        cache.add(_changed_key(section), timezone.now(), getattr(settings, "CATALOG_SNAPSHOT_TIMEOUT", 300))
+        changed = cache.get(_changed_key(section)) or timezone.now()
+    return changed
+
+
+def _snapshot_key(section, origin, query):
+    digest = hashlib.md5(f"{origin}?{query}".encode()).hexdigest()
+    return f"snapshot:{section}:{_version(section)}:{digest}"
+
+
+def encode(data):
+    return encode_body(renderers.dumps(data))
+
+
+def encode_body(body):
+    # Compressed once here; requests just pick an encoding
+    return {"body": body, **compression.compress(body)}
+
+
+def get_snapshot(section, origin, path, query=""):
+    """Return the encoded payload for a section, building it on a miss."""
+    build = SECTIONS[section][0]
+    key = _snapshot_key(section, origin, query)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = encode(build(SnapshotRequest(origin, path, query)))
+        cache.set(key, snapshot, getattr(settings, "CATALOG_SNAPSHOT_TIMEOUT", 300))
+    with _seen_lock:
+        seen = _seen[section]
+        seen[origin, path] = None
+        seen.move_to_end((origin, path))
+        if len(seen) > SEEN_LIMIT:
+            seen.popitem(last=False)
+    return snapshot
+
+
+def serve(request, section):
+    build, params = SECTIONS[section]
+    # Browsable API and other renderers still go through DRF
+    if request.accepted_renderer.format != "json":
+        return Response(build(request))
+
+    query = urlencode([(name, request.query_params[name]) for name in params if name in request.query_params])
+    snapshot = get_snapshot(section, request_origin(request), request.path, query)
+    return respond(request, snapshot)
+
+
+def serve_home(request):
+    """All HOME_SECTIONS in one document, stitched together from their snapshot bytes."""
+    if request.accepted_renderer.format != "json":
+        return Response({section: SECTIONS[section][0](request) for section in HOME_SECTIONS})
+
+    origin = request_origin(request)
+    versions = ":".join(_version(section) for section in HOME_SECTIONS)
+    key = "snapshot:home:" + hashlib.md5(f"{origin}|{versions}".encode()).hexdigest()
+    snapshot = cache.get(key)
+    if snapshot is None:
+        fragments = (
+            b'"%s":%s' % (section.encode(), get_snapshot(section, origin, request.path)["body"])
+            for section in HOME_SECTIONS
+        )
+        snapshot = encode_body(b"{" + b",".join(fragments) + b"}")
+        cache.set(key, snapshot, getattr(settings, "CATALOG_SNAPSHOT_TIMEOUT", 300))
+    return respond(request, snapshot)
+
+
+def request_origin(request):
+    return f"{request.scheme}://{request.get_host()}"
+
+
+def respond(request, snapshot):
+    response = HttpResponse(content_type="application/json")
+    coding = compression.negotiate(request, [name for name in compression.ENCODINGS if name in snapshot])
+    if coding is not None:
+        response.content = snapshot[coding]
+        response.headers["Content-Encoding"] = coding
+    else:
+        response.content = snapshot["body"]
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def invalidate(*sections):
+    """Drop the current snapshots of ``sections`` and rebuild them in the background.
+
+    Both happen once the change commits: bumping the version earlier would let
+    a concurrent request cache the old rows under the new version.
+    """
+    def bump():
+        now = timezone.now()
+        for section in sections:
+            cache.set(_version_key(section), uuid.uuid4().hex, None)
+            # Deletes too, which max(updated_at) never shows (see conditional.py)
+            cache.set(_changed_key(section), now, getattr(settings, "CATALOG_SNAPSHOT_TIMEOUT", 300))
+        run_in_background(rebuild, sections)
+
+    transaction.on_commit(bump)
+
+
+def rebuild(sections):
+    for section in sections:
+        with _seen_lock:
+            urls = list(_seen[section])
+        for origin, path in urls:
+            get_snapshot(section, origin, path)
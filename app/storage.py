@@ -0,0 +1,160 @@
+import functools
+import hashlib
+import os
+import posixpath
+import tempfile
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F, FileField
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import MediaBlob
+
+# Blobs are stored as "cas/<aa>/<bb>/<sha256><ext>", so equal uploads share one file
+PREFIX = "cas"
+
+
+def blob_name(digest, extension=""):
+    return f"{PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(PREFIX + "/")
+
+
+def digest(content):
+    """(sha256 hex digest, size) of a File, read in chunks."""
+    sha, size = hashlib.sha256(), 0
+    for chunk in content.chunks():
+        sha.update(chunk)
+        size += len(chunk)
+    return sha.hexdigest(), size
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names uploads after their content.
+
+    ``save()`` ignores the requested name apart from its extension and
+    returns the blob's name; a blob that is already stored isn't written
+    again. Any other name (files saved before this storage, renditions)
+    opens exactly as with FileSystemStorage.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the real name, and an existing blob is the same file
+        return name
+
+    def _save(self, name, content):
+        sha, size = digest(content)
+        name = blob_name(sha, posixpath.splitext(name)[1])
+        try:
+            # Reusing a stored blob: mark it used so the media GC's grace period
+            # covers it until the row about to reference it is committed. The
+            # access time records that; renditions and ETags go by the mtime.
+            os.utime(self.path(name), ns=(time.time_ns(), os.stat(self.path(name)).st_mtime_ns))
+        except FileNotFoundError:
+            self._write(name, content)
+        MediaBlob.objects.get_or_create(name=name, defaults={"size": size})
+        return name
+
+    def _write(self, name, content):
+        directory = os.path.dirname(self.path(name))
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        # Write aside and rename, so a concurrent save of the same content is harmless
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                for chunk in content.chunks():
+                    temp.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, self.path(name))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def delete(self, name):
+        # A blob still referenced elsewhere stays; the media GC removes unreferenced ones
+        if is_blob(name) and MediaBlob.objects.filter(name=name, refcount__gt=0).exists():
+            return
+        super().delete(name)
+        if is_blob(name):
+            MediaBlob.objects.filter(name=name).delete()
+
+
+# Reference counting
+
+@functools.cache
+def file_fields():
+    """{model: [file field attnames]} for the app's models that store files."""
+    fields = {}
+    for model in apps.get_app_config("app").get_models():
+        names = [field.attname for field in model._meta.concrete_fields if isinstance(field, FileField)]
+        if names:
+            fields[model] = names
+    return fields
+
+
+def stored_names(instance):
+    """Names of the files an instance points at (its in-memory values)."""
+    return [str(getattr(instance, name)) for name in file_fields()[type(instance)] if getattr(instance, name)]
+
+
+def saved_names(model, pk):
+    """Names of the files the saved row ``pk`` points at."""
+    row = model._base_manager.filter(pk=pk).values_list(*file_fields()[model]).first()
+    return [name for name in row or () if name]
+
+
+def _adjust(counts, sign):
+    now = timezone.now()
+    for name, count in counts.items():
+        if not is_blob(name):
+            continue
+        refcount = F("refcount") + count if sign > 0 else Greatest(F("refcount") - count, 0)
+        MediaBlob.objects.filter(name=name).update(refcount=refcount, updated_at=now)
+
+
+def track(before, after):
+    """Move blob refcounts from the names in ``before`` to those in ``after``."""
+    before, after = Counter(before), Counter(after)
+    _adjust(after - before, 1)
+    _adjust(before - after, -1)
+
+
+def references():
+    """Counter of stored file names across every file field of the app."""
+    counts = Counter()
+    for model, names in file_fields().items():
+        for name in names:
+            counts.update(
+                model._base_manager.exclude(**{f"{name}__isnull": True}).exclude(**{name: ""})
+                .values_list(name, flat=True).iterator()
+            )
+    return counts
+
+
+def recount(batch_size=500):
+    """Reset every blob's refcount from the rows that reference it; returns how many changed."""
+    counts = references()
+    now = timezone.now()
+    changed = []
+    for blob in MediaBlob.objects.only("id", "name", "refcount").iterator():
+        refcount = counts.get(blob.name, 0)
+        if blob.refcount != refcount:
+            blob.refcount, blob.updated_at = refcount, now
+            changed.append(blob)
+    MediaBlob.objects.bulk_update(changed, ["refcount", "updated_at"], batch_size=batch_size)
+    return len(changed)
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.response import Response
+
+from .renderers import FastJSONRenderer, NDJSONRenderer
+
+
+def serialized_chunks(queryset, serializer_class, context=None, chunk_size=None):
+    """Serialize ``queryset`` ``chunk_size`` rows at a time via ``.iterator()``.
+
+    Prefetches on the queryset run once per chunk, so memory is bounded by
+    the chunk rather than the table.
+    """
+    chunk_size = chunk_size or getattr(settings, "API_STREAM_CHUNK_SIZE", 500)
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield serializer_class(chunk, many=True, context=context).data
+            chunk = []
+    if chunk:
+        yield serializer_class(chunk, many=True, context=context).data
+
+
+def json_array(chunks, renderer):
+    yield b"["
+    first = True
+    for items in chunks:
+        if not items:
+            continue
+        # "[a,b]" -> "a,b", so each chunk is encoded in one call
+        body = renderer.render(items)[1:-1]
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+
+def ndjson(chunks, renderer):
+    for items in chunks:
+        yield renderer.render(items)
+
+
+def stream_list(request, queryset, serializer_class, context=None):
+    """Stream ``queryset`` as a JSON array, or as NDJSON when that was negotiated.
+
+    Other renderers (the browsable API, ``?indent``) get a regular Response.
+    """
+    renderer = request.accepted_renderer
+    chunks = serialized_chunks(queryset, serializer_class, context)
+    if isinstance(renderer, NDJSONRenderer):
+        return StreamingHttpResponse(ndjson(chunks, renderer), content_type=renderer.media_type)
+    if isinstance(renderer, FastJSONRenderer) and renderer.get_indent(request.accepted_media_type, {}) is None:
+        return StreamingHttpResponse(json_array(chunks, renderer), content_type=renderer.media_type)
+    return Response(serializer_class(queryset, many=True, context=context).data)
@@ -0,0 +1,70 @@
+from collections import defaultdict
+
+from django.db.models import Count
+
+from .models import Product, ProductImage, ProductVariant
+
+# Product columns maintained here
+SUMMARY_FIELDS = (
+    "variant_count",
+    "variant_stock",
+    "min_variant_price",
+    "max_variant_price",
+    "effective_price",
+    "gallery_count",
+    "has_image",
+)
+
+BATCH_SIZE = 500
+
+
+def summarize(product, variants, gallery_count):
+    """Summary values for ``product`` given its (price, sale_price, stock) variant rows."""
+    prices = [price for price, _, _ in variants]
+    paid = [sale_price if sale_price is not None else price for price, sale_price, _ in variants]
+    if paid:
+        effective_price = min(paid)
+    else:
+        effective_price = product.sale_price if product.sale_price is not None else product.regular_price
+    return {
+        "variant_count": len(variants),
+        "variant_stock": sum(stock for _, _, stock in variants),
+        "min_variant_price": min(prices) if prices else None,
+        "max_variant_price": max(prices) if prices else None,
+        "effective_price": effective_price,
+        "gallery_count": gallery_count,
+        "has_image": bool(product.image) or gallery_count > 0,
+    }
+
+
+def refresh_products(product_ids):
+    """Recompute the summary columns of ``product_ids``; returns how many rows changed.
+
+    Three reads and one bulk update per batch, with no save() signals.
+    """
+    product_ids = list(product_ids)
+    changed = 0
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+
+        variants = defaultdict(list)
+        rows = ProductVariant.objects.filter(product_id__in=batch).values_list("product_id", "price", "sale_price", "stock")
+        for product_id, *row in rows:
+            variants[product_id].append(row)
+
+        galleries = dict(
+            ProductImage.objects.filter(product_id__in=batch).order_by()
+            .values("product_id").annotate(count=Count("id")).values_list("product_id", "count")
+        )
+
+        updates = []
+        products = Product.objects.filter(pk__in=batch).only("id", "image", "regular_price", "sale_price", *SUMMARY_FIELDS)
+        for product in products:
+            summary = summarize(product, variants[product.pk], galleries.get(product.pk, 0))
+            if any(getattr(product, field) != value for field, value in summary.items()):
+                for field, value in summary.items():
+                    setattr(product, field, value)
+                updates.append(product)
+        Product.objects.bulk_update(updates, SUMMARY_FIELDS)
+        changed += len(updates)
+    return changed
@@ -0,0 +1,77 @@
+import base64
+import binascii
+
+from django.db.models import Max
+from rest_framework.exceptions import ValidationError
+
+from .models import ChangeLog, Product
+from .serializers import ProductSerializer
+
+# Max change-log rows folded into one delta response; clients follow has_more.
+DELTA_BATCH_SIZE = 1000
+
+
+def encode_token(change_id):
+    return base64.urlsafe_b64encode(f"cl:{change_id}".encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        prefix, change_id = raw.split(":")
+        if prefix != "cl":
+            raise ValueError
+        return int(change_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValidationError({"since": "Invalid sync token."})
+
+
+def current_token():
+    latest = ChangeLog.objects.aggregate(latest=Max("id"))["latest"] or 0
+    return encode_token(latest)
+
+
+def record_products(product_ids, action=ChangeLog.UPSERT):
+    ChangeLog.objects.bulk_create(
+        ChangeLog(model=ChangeLog.PRODUCT, object_id=product_id, action=action)
+        for product_id in product_ids
+    )
+
+
+def record_variant_deleted(variant_id):
+    ChangeLog.objects.create(model=ChangeLog.VARIANT, object_id=variant_id, action=ChangeLog.DELETE)
+
+
+def product_delta(request, token):
+    """Products changed and tombstones recorded after ``token``."""
+    since = decode_token(token)
+    entries = list(
+        ChangeLog.objects.filter(id__gt=since)
+        .order_by("id")
+        .values_list("id", "model", "object_id", "action")[:DELTA_BATCH_SIZE + 1]
+    )
+    has_more = len(entries) > DELTA_BATCH_SIZE
+    entries = entries[:DELTA_BATCH_SIZE]
+
+    changed, deleted_products, deleted_variants = set(), set(), set()
+    for _, model, object_id, action in entries:
+        if model == ChangeLog.VARIANT:
+            deleted_variants.add(object_id)
+        elif action == ChangeLog.DELETE:
+            deleted_products.add(object_id)
+            changed.discard(object_id)
+        elif object_id not in deleted_products:
+            changed.add(object_id)
+
+    products = ProductSerializer.optimize_queryset(
+        Product.objects.filter(id__in=changed).order_by("-id"), request.query_params
+    )
+    return {
+        "sync_token": encode_token(entries[-1][0] if entries else since),
+        "has_more": has_more,
+        "products": ProductSerializer(products, many=True, context={"request": request}).data,
+        "deleted": {
+            "products": sorted(deleted_products),
+            "variants": sorted(deleted_variants),
+        },
+    }
@@ -0,0 +1,49 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# One thread pool per queue, so slow jobs (remote downloads) can't hold up the rest
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(queue):
+    with _executors_lock:
+        if queue not in _executors:
+            workers = getattr(settings, "BACKGROUND_TASK_QUEUES", {}).get(queue)
+            _executors[queue] = ThreadPoolExecutor(
+                max_workers=workers or getattr(settings, "BACKGROUND_TASK_WORKERS", 2),
+                thread_name_prefix=f"dkt-{queue}",
+            )
+        return _executors[queue]
+
+
+def run_in_queue(queue, func, *args, **kwargs):
+    """Run ``func`` on ``queue``'s workers once the current transaction commits."""
+    def submit():
+        if getattr(settings, "BACKGROUND_TASKS_EAGER", False):
+            _run(func, args, kwargs)
+        else:
+            _executor(queue).submit(_run, func, args, kwargs)
+
+    transaction.on_commit(submit)
+
+
+def run_in_background(func, *args, **kwargs):
+    """Run ``func`` off the request thread once the current transaction commits."""
+    run_in_queue("default", func, *args, **kwargs)
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(func, "__name__", func))
+    finally:
+        if not getattr(settings, "BACKGROUND_TASKS_EAGER", False):
+            connections.close_all()
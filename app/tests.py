@@ -1,3 +1,1381 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from . import compression, facets, fastpath, ingest, media_gc, placeholders, renderers, renditions, search, snapshots, storage, summaries, uploads, variants
+from .models import AppUser, Banner, MediaBlob, MediaSweep, Category, Hero, Brand, Order, OrderItem, Product, ProductImage, ProductVariant, Redeem, VariantOption, VariantValue
+from .serializers import BannerSerializer, BrandSerializer, CategorySerializer, HeroSerializer, OrderSerializer, ProductSerializer, ProductVariantSerializer, RedeemSerializer
+
+
+def make_catalog(count):
+    category = Category.objects.create(name="Care", slug="care")
+    brand = Brand.objects.create(name="Josh", slug="josh")
+    for i in range(count):
+        product = Product.objects.create(
+            name=f"Product {i}",
+            slug=f"product-{i}",
+            category=category,
+            brand=brand,
+            short_description="short",
+            regular_price="100.00",
+        )
+        ProductImage.objects.create(product=product, image=f"products/gallery/{i}.jpg")
+        ProductVariant.objects.create(product=product, sku=f"SKU-{i}", price="90.00", stock=3)
+    return category, brand
+
+
+def streamed(response):
+    return b"".join(response.streaming_content)
+
+
+class ProductListApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(45)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_walk_catalog_by_descending_id(self):
+        seen = []
+        url = reverse("product-list-api")
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(product["id"] for product in data["results"])
+            url = data["next"]
+        self.assertEqual(seen, list(Product.objects.order_by("-id").values_list("id", flat=True)))
+
+    def test_query_count_is_fixed_per_page(self):
+        path = reverse("product-list-api")
+        for page_size in (5, 40):
+            request = snapshots.SnapshotRequest("http://testserver", path, f"page_size={page_size}")
+            # sync token, products, gallery images, variants, facets
+            with self.assertNumQueries(5):
+                results = snapshots.build_products(request)["results"]
+            self.assertEqual(len(results), page_size)
+            self.assertEqual(results[0]["category"], "Care")
+            self.assertEqual(len(results[0]["variants"]), 1)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(3)
+
+    def test_repeat_requests_are_served_without_queries(self):
+        url = reverse("product-list-api")
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            snapshot = snapshots.get_snapshot("products", "http://testserver", url)
+        self.assertEqual(first.content, snapshot["body"])
+
+    def test_gzip_variant_matches_body(self):
+        url = reverse("api_category_list")
+        plain = self.client.get(url)
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+
+    @skipUnless(compression.brotli, "brotli is not installed")
+    def test_brotli_is_preferred_and_cached(self):
+        url = reverse("product-list-api")
+        plain = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(compression.brotli.decompress(response.content), plain.content)
+        snapshot = snapshots.get_snapshot("products", "http://testserver", url)
+        self.assertEqual(response.content, snapshot["br"])
+
+    def test_admin_edit_rebuilds_snapshot(self):
+        url = reverse("product-list-api")
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.update_or_create(slug="care", defaults={"name": "Personal Care"})
+        with self.assertNumQueries(0):
+            snapshot = snapshots.get_snapshot("products", "http://testserver", url)
+        self.assertIn(b'"category":"Personal Care"', snapshot["body"])
+
+    def test_version_moves_only_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            before = snapshots._version("categories")
+            Category.objects.filter(slug="care").get().save()
+            # A concurrent request would still read the committed rows: keep their version
+            self.assertEqual(snapshots._version("categories"), before)
+        self.assertNotEqual(snapshots._version("categories"), before)
+
+    def test_warmed_urls_are_capped(self):
+        for port in range(snapshots.SEEN_LIMIT + 5):
+            snapshots.get_snapshot("heros", f"http://testserver:{port}", "/api/heros/")
+        self.assertEqual(len(snapshots._seen["heros"]), snapshots.SEEN_LIMIT)
+        self.assertIn((f"http://testserver:{snapshots.SEEN_LIMIT + 4}", "/api/heros/"), snapshots._seen["heros"])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(2)
+
+    def test_matching_etag_returns_304(self):
+        for name in ("product-list-api", "api_category_list", "api_banner_list", "api_ad_list", "api_hero_list", "redeem-list-api"):
+            url = reverse(name)
+            response = self.client.get(url)
+            self.assertTrue(response["ETag"].startswith('W/"'))
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(cached.status_code, 304, name)
+            self.assertEqual(cached.content, b"")
+
+    def test_edit_changes_validator(self):
+        url = reverse("product-list-api")
+        etag = self.client.get(url)["ETag"]
+        ProductVariant.objects.filter(sku="SKU-0").update(stock=0, updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_delete_is_not_hidden_by_if_modified_since(self):
+        earlier = timezone.now() - timedelta(seconds=10)
+        Category.objects.update(updated_at=earlier)
+        Brand.objects.update(updated_at=earlier)
+        with mock.patch("django.utils.timezone.now", return_value=earlier), self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Gone", slug="gone")
+            for section in snapshots.HOME_SECTIONS:
+                snapshots.invalidate(section)
+
+        for url in (reverse("api_category_list"), reverse("api_home_feed")):
+            response = self.client.get(url)
+            self.assertEqual(response["Last-Modified"], http_date(earlier.timestamp()))
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.get(slug="gone").delete()
+        for url in (reverse("api_category_list"), reverse("api_home_feed")):
+            since = http_date(earlier.timestamp())
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_validator_follows_cursor(self):
+        url = reverse("product-list-api")
+        etag = self.client.get(url, {"page_size": 1})["ETag"]
+        response = self.client.get(url, {"page_size": 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(3)
+
+    def test_delta_returns_changes_and_tombstones(self):
+        url = reverse("product-list-api")
+        token = self.client.get(url).json()["sync_token"]
+
+        edited = Product.objects.get(slug="product-1")
+        edited.name = "Renamed"
+        edited.save()
+        variant_id = ProductVariant.objects.get(sku="SKU-2").pk
+        ProductVariant.objects.filter(pk=variant_id).delete()
+        removed_id = Product.objects.get(slug="product-0").pk
+        Product.objects.filter(pk=removed_id).delete()
+
+        data = self.client.get(url, {"since": token}).json()
+        self.assertEqual([p["name"] for p in data["products"]], ["Product 2", "Renamed"])
+        self.assertEqual(data["deleted"]["products"], [removed_id])
+        self.assertIn(variant_id, data["deleted"]["variants"])
+        self.assertFalse(data["has_more"])
+
+        empty = self.client.get(url, {"since": data["sync_token"]}).json()
+        self.assertEqual(empty["products"], [])
+        self.assertEqual(empty["sync_token"], data["sync_token"])
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.get(reverse("product-list-api"), {"since": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        category, brand = make_catalog(2)
+        Product.objects.create(
+            name="Plain Pack", slug="plain", category=category, short_description="short",
+            description="Tastes like strawberry",
+        )
+        Product.objects.create(name="Strawberry Gel", slug="strawberry", category=category, short_description="short")
+
+    def test_results_are_ranked_and_paginated(self):
+        data = self.client.get(reverse("product-search-api"), {"q": "straw", "page_size": 1}).json()
+        self.assertEqual(data["count"], 2)
+        self.assertEqual([p["name"] for p in data["results"]], ["Strawberry Gel"])
+        self.assertIsNotNone(data["next"])
+
+    def test_index_follows_edits(self):
+        product = Product.objects.get(slug="product-0")
+        product.name = "Mint Delay"
+        product.save()
+        self.assertEqual([p.slug for p in search.search_products("mint")], ["product-0"])
+        Product.objects.filter(slug="product-0").delete()
+        self.assertEqual(search.search_products("mint"), [])
+
+
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category, brand = make_catalog(3)
+        other = Category.objects.create(name="Gifts", slug="gifts")
+        Product.objects.create(
+            name="Gift Box", slug="gift-box", category=other, short_description="short",
+            regular_price="3000.00", sale_price="2400.00", stock_status="outofstock",
+        )
+
+    def test_filters_and_facets(self):
+        url = reverse("product-list-api")
+        data = self.client.get(url, {"category": "gifts"}).json()
+        self.assertEqual([p["slug"] for p in data["results"]], ["gift-box"])
+
+        data = self.client.get(url, {"min_price": "2000", "max_price": "2500"}).json()
+        self.assertEqual([p["slug"] for p in data["results"]], ["gift-box"])
+
+        facets = self.client.get(url).json()["facets"]
+        self.assertEqual([(c["slug"], c["count"]) for c in facets["category"]], [("care", 3), ("gifts", 1)])
+        self.assertEqual(facets["brand"][0]["count"], 3)
+        self.assertEqual(facets["stock_status"], [{"value": "instock", "count": 3}, {"value": "outofstock", "count": 1}])
+        self.assertEqual(facets["price"], [{"range": "0-500", "count": 3}, {"range": "1000-2500", "count": 1}])
+
+    def test_facets_are_one_query(self):
+        with self.assertNumQueries(1):
+            facets.product_facets(Product.objects.all())
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get(reverse("product-list-api"), {"stock_status": "sold"})
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(3)
+        user = AppUser.objects.create(number="+923001234567", password_hash="x")
+        order = Order.objects.create(user=user, address="", shipping="")
+        OrderItem.objects.create(order=order, name="Gel", pts=5, price="100.00")
+
+    def test_product_fields_skip_unrequested_relations(self):
+        path = reverse("product-list-api")
+        request = snapshots.SnapshotRequest("http://testserver", path, "fields=id,name,image")
+        # sync token, products, facets
+        with self.assertNumQueries(3):
+            results = snapshots.build_products(request)["results"]
+        self.assertEqual(set(results[0]), {"id", "name", "image"})
+
+        results = self.client.get(path, {"fields": "id", "expand": "variants"}).json()["results"]
+        self.assertEqual(set(results[0]), {"id", "variants"})
+
+    def test_order_list_without_user_detail(self):
+        url = reverse("list-orders")
+        full = json.loads(streamed(self.client.get(url)))[0]
+        self.assertIn("user_detail", full)
+        with self.assertNumQueries(2):
+            sparse = json.loads(streamed(self.client.get(url, {"fields": "id,status,items"})))[0]
+        self.assertEqual(set(sparse), {"id", "status", "items"})
+
+
+    def test_expand_collapses_unnamed_relations(self):
+        url = reverse("list-orders")
+        user = AppUser.objects.get()
+        # One query: the order rows; no user, addresses, points, items or payments
+        with self.assertNumQueries(1):
+            collapsed = json.loads(streamed(self.client.get(url, {"expand": ""})))[0]
+        self.assertEqual(collapsed["user"], user.pk)
+        self.assertFalse({"user_detail", "items", "payments"} & set(collapsed))
+
+        expanded = json.loads(streamed(self.client.get(url, {"expand": "items"})))[0]
+        self.assertEqual((expanded["user"], expanded["items"][0]["name"]), (user.pk, "Gel"))
+        self.assertNotIn("payments", expanded)
+
+        sparse = json.loads(streamed(self.client.get(url, {"fields": "id,user", "expand": ""})))[0]
+        self.assertEqual(sparse, {"id": collapsed["id"], "user": user.pk})
+
+        product = self.client.get(reverse("product-list-api"), {"expand": "variants"}).json()["results"][0]
+        self.assertIn("variants", product)
+        self.assertNotIn("gallery_images", product)
+        self.assertIn("description", product)
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class HomeFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category, brand = make_catalog(1)
+        Banner.objects.create(category=category, brand=brand, image="banners/a.png")
+        Hero.objects.create(title="Hi", subtext="There")
+
+    def test_home_bundles_sections(self):
+        home = self.client.get(reverse("api_home_feed")).json()
+        self.assertEqual(list(home), list(snapshots.HOME_SECTIONS))
+        self.assertEqual(home["banners"], self.client.get(reverse("api_banner_list")).json())
+        self.assertEqual(home["heros"][0]["title"], "Hi")
+
+    def test_section_edit_only_invalidates_that_section(self):
+        url = reverse("api_home_feed")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        categories_key = snapshots._snapshot_key("categories", "http://testserver", "")
+        with self.captureOnCommitCallbacks(execute=True):
+            Hero.objects.create(title="New", subtext="Hero")
+        self.assertEqual(snapshots._snapshot_key("categories", "http://testserver", ""), categories_key)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["heros"]), 2)
+
+
+class FastPathTests(TestCase):
+    def setUp(self):
+        category, brand = make_catalog(3)
+        Category.objects.create(name="Crème", slug="creme", image="category/images/a b (1).png")
+        Product.objects.create(
+            name="Ünbranded", slug="unbranded", category=category, short_description="short",
+            image="products/main/x y.jpg", sale_price="12.50", regular_price="99",
+        )
+        ProductVariant.objects.create(
+            product=Product.objects.get(slug="product-1"), sku="SKU-X", price="5",
+            attributes={"options": {"Color": "Red"}, "points": "4"}, image="products/variants/v.jpg",
+        )
+        Hero.objects.create(title="Hi", subtext="There", image="heros/h.png")
+        Redeem.objects.create(subtitle="s", title="t", description="d", points_required=460, image="redeem/r.png")
+        self.request = snapshots.SnapshotRequest("https://shop.example", "/api/products/")
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_list_output_is_byte_identical(self):
+        cases = [
+            (Category, CategorySerializer, fastpath.CATEGORY_FIELDS),
+            (Brand, BrandSerializer, fastpath.BRAND_FIELDS),
+            (Hero, HeroSerializer, fastpath.HERO_FIELDS),
+            (Redeem, RedeemSerializer, fastpath.REDEEM_FIELDS),
+        ]
+        for model, serializer_class, fields in cases:
+            queryset = model.objects.order_by("-id")
+            expected = serializer_class(queryset, many=True, context={"request": self.request}).data
+            self.assertEqual(self.render(fastpath.serialize_queryset(queryset, fields, self.request)), self.render(expected))
+
+    def test_product_output_is_byte_identical(self):
+        products = Product.objects.order_by("-id")
+        expected = ProductSerializer(products, many=True, context={"request": self.request}).data
+        rows = products.values(*fastpath.columns(fastpath.PRODUCT_FIELDS))
+        self.assertEqual(self.render(fastpath.serialize_products(list(rows), self.request)), self.render(expected))
+
+
+class RendererTests(TestCase):
+    def test_output_matches_drf_renderer(self):
+        data = {
+            "price": Decimal("12.50"),
+            "at": timezone.now(),
+            "day": timezone.now().date(),
+            "text": "Crème \u2028 line \u2029 para",
+            "nested": [{"n": 1, "none": None, "ok": True}],
+            3: "int key",
+        }
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_unsupported_values_fall_back(self):
+        data = {"big": 2 ** 70}
+        self.assertEqual(renderers.dumps(data), JSONRenderer().render(data))
+
+
+@override_settings(API_STREAM_CHUNK_SIZE=2)
+class StreamingListTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            user = AppUser.objects.create(number=f"+92300000000{i}", password_hash="x")
+            order = Order.objects.create(user=user, address="Street", shipping="TCS")
+            OrderItem.objects.create(order=order, name=f"Item {i}", pts=5, price="100.00")
+
+    def test_json_array_matches_serializer(self):
+        response = self.client.get(reverse("list-orders"))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/json")
+        orders = Order.objects.order_by("-created_at")
+        expected = OrderSerializer(orders, many=True, context={"query_params": {}}).data
+        self.assertEqual(json.loads(streamed(response)), json.loads(JSONRenderer().render(expected)))
+
+    def test_ndjson(self):
+        response = self.client.get(reverse("list-orders"), HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = streamed(response).splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual({json.loads(line)["id"] for line in lines}, set(Order.objects.values_list("id", flat=True)))
+
+    def test_empty_list(self):
+        Order.objects.all().delete()
+        self.assertEqual(streamed(self.client.get(reverse("list-orders"))), b"[]")
+
+
+class CompressionTests(TestCase):
+    def test_accept_encoding_negotiation(self):
+        factory = RequestFactory()
+        cases = [
+            ("gzip, deflate, br", "br"),
+            ("br;q=0, gzip", "gzip"),
+            ("gzip;q=0", None),
+            ("*", "br"),
+            ("*, br;q=0", "gzip"),
+            ("", None),
+        ]
+        for header, expected in cases:
+            request = factory.get("/", HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(compression.negotiate(request, ("br", "gzip")), expected, header)
+        request = factory.get("/", HTTP_ACCEPT_ENCODING="br, gzip")
+        self.assertEqual(compression.negotiate(request, ("gzip",)), "gzip")
+
+    def test_streamed_order_list_is_gzipped(self):
+        for i in range(20):
+            Order.objects.create(address=f"Street {i}", shipping="TCS")
+        plain = streamed(self.client.get(reverse("list-orders")))
+        response = self.client.get(reverse("list-orders"), HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(streamed(response)), plain)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ProductDetailApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_catalog(2)
+        self.product = Product.objects.get(slug="product-1")
+        option = VariantOption.objects.create(product=self.product, name="Size")
+        self.value = VariantValue.objects.create(option=option, value="Small")
+
+    def url(self, name, lookup):
+        return reverse(name, args=[lookup])
+
+    def test_lookup_by_id_or_slug(self):
+        by_id = self.client.get(self.url("product-detail-api", self.product.pk))
+        by_slug = self.client.get(self.url("product-detail-api", "product-1"))
+        self.assertEqual(by_id.content, by_slug.content)
+        self.assertEqual(by_id.json()["name"], "Product 1")
+        self.assertEqual(self.client.get(self.url("product-detail-api", "nope")).status_code, 404)
+        self.assertEqual(self.client.get(self.url("product-variants-api", 999999)).status_code, 404)
+
+    def test_documents_are_cached(self):
+        for name in ("product-detail-api", "product-variants-api", "product-options-api"):
+            first = self.client.get(self.url(name, "product-1"))
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(self.url(name, "product-1")).content, first.content)
+
+    def test_child_edits_invalidate_document(self):
+        variants_url = self.url("product-variants-api", self.product.pk)
+        options_url = self.url("product-options-api", self.product.pk)
+        self.client.get(variants_url)
+        self.client.get(options_url)
+
+        before = self.client.get(variants_url).content
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.filter(product=self.product).get().delete()
+            # Versions only move on commit, so nothing is cached against uncommitted rows
+            self.assertEqual(self.client.get(variants_url).content, before)
+        self.assertEqual(self.client.get(variants_url).json(), [])
+
+        self.value.value = "Large"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.value.save()
+        options = self.client.get(options_url).json()
+        self.assertEqual(options, [{"id": self.value.option_id, "name": "Size", "values": [{"id": self.value.pk, "value": "Large"}]}])
+
+    def test_slug_change_and_category_rename(self):
+        self.client.get(self.url("product-detail-api", "product-1"))
+        self.product.slug = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get(self.url("product-detail-api", "product-1")).status_code, 404)
+        self.assertEqual(self.client.get(self.url("product-detail-api", "renamed")).json()["slug"], "renamed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.update_or_create(slug="care", defaults={"name": "Personal"})
+        self.assertEqual(self.client.get(self.url("product-detail-api", "renamed")).json()["category"], "Personal")
+
+
+class VariantResolveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category, brand = make_catalog(1)
+        self.product = Product.objects.create(
+            name="Shirt", slug="shirt", category=category, short_description="short", product_type="variable",
+        )
+        index = variants.OptionIndex(self.product)
+        stock = {("Red", "S"): 2, ("Red", "L"): 0, ("Blue", "S"): 1, ("Blue", "L"): 4}
+        for (color, size), count in stock.items():
+            options = {"Color": color, "Size": size}
+            ProductVariant.objects.create(
+                product=self.product, sku=f"SH-{color}-{size}", price="10.00", stock=count,
+                attributes={"options": options}, combination_key=index.key(options),
+            )
+        self.value = {value.value: value.pk for value in VariantValue.objects.filter(option__product=self.product)}
+        self.option = {option.name: option.pk for option in VariantOption.objects.filter(product=self.product)}
+
+    def resolve(self, *values):
+        url = reverse("product-variant-resolve-api", args=["shirt"])
+        return self.client.get(url, {"values": ",".join(str(self.value[value]) for value in values)})
+
+    def available(self, data):
+        return {item["option"]: set(item["values"]) for item in data["available"]}
+
+    def test_full_selection_resolves_variant(self):
+        data = self.resolve("Blue", "L").json()
+        self.assertEqual(data["variant"]["sku"], "SH-Blue-L")
+        self.assertEqual(data["variant"]["stock"], 4)
+
+    def test_partial_selection_greys_out_unavailable_values(self):
+        data = self.resolve("Red").json()
+        self.assertIsNone(data["variant"])
+        available = self.available(data)
+        # Red/L is out of stock; every color still has some size in stock
+        self.assertEqual(available[self.option["Size"]], {self.value["S"]})
+        self.assertEqual(available[self.option["Color"]], {self.value["Red"], self.value["Blue"]})
+
+    def test_invalid_selection_is_rejected(self):
+        self.assertEqual(self.resolve("Red", "Blue").status_code, 400)
+        url = reverse("product-variant-resolve-api", args=["shirt"])
+        self.assertEqual(self.client.get(url, {"values": "abc"}).status_code, 400)
+
+    def test_stock_change_invalidates_resolution(self):
+        self.assertEqual(self.resolve("Red", "L").json()["variant"]["stock"], 0)
+        variant = ProductVariant.objects.get(sku="SH-Red-L")
+        variant.stock = 5
+        variant.save()
+        data = self.resolve("Red").json()
+        self.assertEqual(self.available(data)[self.option["Size"]], {self.value["S"], self.value["L"]})
+
+    def test_prune_drops_unused_values(self):
+        ProductVariant.objects.filter(attributes__options__Color="Blue").delete()
+        variants.OptionIndex(self.product).prune()
+        self.assertEqual(
+            set(VariantValue.objects.filter(option__product=self.product).values_list("value", flat=True)),
+            {"Red", "S", "L"},
+        )
+
+
+class ProductSummaryTests(TestCase):
+    def setUp(self):
+        category, brand = make_catalog(1)
+        self.product = Product.objects.create(
+            name="Kit", slug="kit", category=category, short_description="short", regular_price="50.00", sale_price="45.00",
+        )
+
+    def summary(self):
+        self.product.refresh_from_db()
+        return {field: getattr(self.product, field) for field in summaries.SUMMARY_FIELDS}
+
+    def test_follows_variant_and_image_changes(self):
+        self.assertEqual(self.summary()["effective_price"], Decimal("45.00"))
+        self.assertFalse(self.summary()["has_image"])
+
+        ProductVariant.objects.create(product=self.product, sku="K-1", price="30.00", stock=2)
+        cheap = ProductVariant.objects.create(
+            product=self.product, sku="K-2", price="20.00", sale_price="15.50", stock=5,
+        )
+        ProductImage.objects.create(product=self.product, image="products/gallery/k.jpg")
+        self.assertEqual(self.summary(), {
+            "variant_count": 2,
+            "variant_stock": 7,
+            "min_variant_price": Decimal("20.00"),
+            "max_variant_price": Decimal("30.00"),
+            "effective_price": Decimal("15.50"),
+            "gallery_count": 1,
+            "has_image": True,
+        })
+
+        cheap.delete()
+        summary = self.summary()
+        self.assertEqual((summary["variant_stock"], summary["effective_price"]), (2, Decimal("30.00")))
+
+    def test_recompute_command(self):
+        ProductVariant.objects.create(product=self.product, sku="K-1", price="30.00", stock=2)
+        Product.objects.update(variant_stock=0, effective_price=None)
+        call_command("recompute_product_summaries", stdout=StringIO())
+        summary = self.summary()
+        self.assertEqual((summary["variant_stock"], summary["effective_price"]), (2, Decimal("30.00")))
+
+    def test_price_filter_needs_no_join(self):
+        queryset = facets.filter_products(Product.objects.all(), QueryDict("min_price=40&max_price=50"))
+        self.assertEqual(list(queryset.values_list("slug", flat=True)), ["kit"])
+        self.assertNotIn("JOIN", str(queryset.query))
+
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ProductSummarySnapshotTests(TransactionTestCase):
+    """Saves outside atomic(): the snapshot rebuild runs straight away."""
+
+    def setUp(self):
+        cache.clear()
+        make_catalog(1)
+
+    def test_list_snapshot_sees_new_summary(self):
+        url = reverse("product-list-api")
+        self.client.get(url)
+        product = Product.objects.get()
+        ProductVariant.objects.create(product=product, sku="K-9", price="5.00", stock=3)
+        listed = next(row for row in self.client.get(url).json()["results"] if row["id"] == product.pk)
+        self.assertEqual((listed["variant_stock"], listed["effective_price"]), (6, "5.00"))
+
+class VariantColumnsTests(TestCase):
+    def test_serializer_keeps_legacy_attributes(self):
+        make_catalog(1)
+        variant = ProductVariant.objects.get()
+        variant.sale_price, variant.points, variant.description = Decimal("80.00"), 4, "Mint"
+        variant.attributes = {"options": {"Flavour": "Mint"}}
+        variant.save()
+        data = ProductVariantSerializer(variant).data
+        self.assertEqual((data["sale_price"], data["points"]), ("80.00", 4))
+        self.assertEqual(data["attributes"], {
+            "options": {"Flavour": "Mint"}, "sale_price": "80.00", "points": "4", "description": "Mint",
+        })
+
+    @mock.patch("builtins.print")  # the view's debug output
+    def test_admin_form_rejects_bad_numbers(self, _print):
+        category, _ = make_catalog(1)
+        product = Product.objects.get()
+        self.client.force_login(User.objects.create_user("admin", password="x"))
+        form = {
+            "name": "Product 0", "slug": "product-0", "category": category.pk, "short_description": "short",
+            "stock_status": "instock", "product_type": "variable",
+            "variants[0][sku]": "SKU-0", "variants[0][regular_price]": "90", "variants[0][stock]": "3",
+        }
+        for field, value in (("sale_price", "Rs 15"), ("points", "2.5"), ("points", "-1"), ("stock", "many")):
+            response = self.client.post(
+                reverse("edit_product", args=[product.pk]), {**form, f"variants[0][{field}]": value}, follow=True,
+            )
+            self.assertEqual(response.status_code, 200)
+            errors = [str(message) for message in response.context["messages"]]
+            self.assertEqual(len(errors), 1, errors)
+            self.assertIn(f'not "{value}"', errors[0])
+            # Nothing was saved or purged
+            self.assertEqual(list(product.variants.values_list("sku", "price")), [("SKU-0", Decimal("90.00"))])
+
+        self.client.post(reverse("edit_product", args=[product.pk]), {**form, "variants[0][sale_price]": " 80.5 ", "variants[0][points]": "4"})
+        variant = product.variants.get()
+        self.assertEqual((variant.sale_price, variant.points, variant.stock), (Decimal("80.50"), 4, 3))
+
+
+def image_file(width, height, fmt="JPEG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, fmt)
+    return ContentFile(buffer.getvalue())
+
+
+class TemporaryMediaRoot:
+    """Runs with MEDIA_ROOT pointed at a throwaway directory."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+
+class MediaTestCase(TemporaryMediaRoot, TestCase):
+    pass
+
+
+class RenditionTests(MediaTestCase):
+    def test_generated_once_and_rebuilt_when_source_changes(self):
+        # A file from before content-addressed storage: it can change in place
+        name = storages["derived"].save("products/main/shirt.jpg", image_file(800, 400))
+        written = renditions.generate(name, sidecars=False)
+        self.assertEqual(len(written), 3)
+        sizes = {width: Image.open(default_storage.path(renditions.rendition_name(name, width))).size for width in (160, 480, 1080)}
+        # Scaled down, never up
+        self.assertEqual(sizes, {160: (160, 80), 480: (480, 240), 1080: (800, 400)})
+        self.assertEqual(renditions.generate(name, sidecars=False), [])
+
+        later = os.path.getmtime(default_storage.path(written[0])) + 10
+        os.utime(default_storage.path(name), (later, later))
+        self.assertEqual(len(renditions.generate(name, sidecars=False)), 3)
+
+    def test_command_skips_decompression_bombs(self):
+        small = default_storage.save("category/images/s.png", image_file(100, 100, "PNG"))
+        large = default_storage.save("category/images/l.png", image_file(800, 400, "PNG"))
+        Category.objects.create(name="Small", slug="small", image=small)
+        Category.objects.create(name="Large", slug="large", image=large)
+        out, err = StringIO(), StringIO()
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 10000):
+            call_command("generate_renditions", stdout=out, stderr=err)
+        self.assertIn("Checked 2 image(s)", out.getvalue())
+        self.assertIn(large, err.getvalue())
+        self.assertTrue(default_storage.exists(renditions.rendition_name(small, 160)))
+
+    def test_reused_blob_keeps_its_renditions(self):
+        name = default_storage.save("products/main/shirt.jpg", image_file(800, 400))
+        self.assertTrue(renditions.generate(name))
+        mtime = os.path.getmtime(default_storage.path(name))
+        etag = self.client.get(f"/media/{name}", HTTP_ACCEPT="image/webp")["ETag"]
+        time.sleep(0.01)
+
+        self.assertEqual(default_storage.save("products/main/copy.jpg", image_file(800, 400)), name)
+        self.assertEqual(os.path.getmtime(default_storage.path(name)), mtime)
+        self.assertEqual(renditions.generate(name), [])
+        response = self.client.get(f"/media/{name}", HTTP_ACCEPT="image/webp")
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_serializers_expose_srcset(self):
+        category = Category.objects.create(name="Care", slug="care", image="category/images/a.png")
+        data = CategorySerializer(category).data
+        self.assertEqual(data["image_srcset"], {
+            "160": "/media/renditions/160/category/images/a.png",
+            "480": "/media/renditions/480/category/images/a.png",
+            "1080": "/media/renditions/1080/category/images/a.png",
+        })
+        category.image = "category/images/a.svg"
+        self.assertIsNone(CategorySerializer(category).data["image_srcset"])
+
+    def test_missing_rendition_is_built_on_request(self):
+        name = default_storage.save("heros/h.png", image_file(600, 600, "PNG"))
+        response = self.client.get(f"/media/renditions/480/{name}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(Image.open(io.BytesIO(b"".join(response.streaming_content))).size, (480, 480))
+        self.assertEqual(self.client.get("/media/renditions/333/heros/h.png").status_code, 404)
+        self.assertEqual(self.client.get("/media/renditions/480/heros/missing.png").status_code, 404)
+
+    def test_decompression_bomb_is_not_found(self):
+        name = default_storage.save("heros/big.png", image_file(600, 600, "PNG"))
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            self.assertEqual(self.client.get(f"/media/renditions/480/{name}").status_code, 404)
+
+
+@override_settings(IMAGE_SIDECAR_FORMATS=("webp",))
+class TranscodeTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        # Flat colour compresses far better as WebP than as PNG
+        self.name = default_storage.save("banners/b.png", image_file(900, 300, "PNG"))
+
+    def test_sidecars_are_served_by_accept(self):
+        self.assertEqual(renditions.transcode(self.name), [self.name + ".webp"])
+        self.assertEqual(renditions.transcode(self.name), [])
+        url = f"/media/{self.name}"
+
+        response = self.client.get(url, HTTP_ACCEPT="image/avif,image/webp,*/*;q=0.8")
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("Accept", response["Vary"])
+        self.assertEqual(Image.open(io.BytesIO(b"".join(response.streaming_content))).format, "WEBP")
+
+        for accept in ("*/*", "image/webp;q=0", ""):
+            self.assertEqual(self.client.get(url, HTTP_ACCEPT=accept)["Content-Type"], "image/png", accept)
+        self.assertEqual(self.client.get("/media/banners/missing.png").status_code, 404)
+
+    def test_stale_sidecar_is_ignored(self):
+        # Only a file outside content-addressed storage can change under its sidecar
+        name = storages["derived"].save("banners/legacy.png", image_file(900, 300, "PNG"))
+        renditions.transcode(name)
+        later = os.path.getmtime(default_storage.path(name + ".webp")) + 10
+        os.utime(default_storage.path(name), (later, later))
+        response = self.client.get(f"/media/{name}", HTTP_ACCEPT="image/webp")
+        self.assertEqual(response["Content-Type"], "image/png")
+
+    def test_backfill_command_walks_media_tree(self):
+        name = default_storage.save("order_items/o.jpg", image_file(50, 50))
+        out = StringIO()
+        call_command("transcode_media", stdout=out)
+        self.assertIn("Checked 2 image(s), wrote 2 sidecar(s).", out.getvalue())
+        self.assertTrue(default_storage.exists(name + ".webp"))
+        call_command("transcode_media", stdout=out)
+        self.assertIn("wrote 0 sidecar(s)", out.getvalue())
+
+    def test_backfill_command_skips_decompression_bombs(self):
+        default_storage.save("order_items/o.jpg", image_file(50, 50))
+        out, err = StringIO(), StringIO()
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 10000):
+            call_command("transcode_media", stdout=out, stderr=err)
+        self.assertIn("Checked 2 image(s), wrote 1 sidecar(s).", out.getvalue())
+        self.assertIn(self.name, err.getvalue())
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name="Care", slug="care")
+
+    def blob(self, name):
+        return MediaBlob.objects.get(name=name)
+
+    def test_equal_uploads_share_one_blob(self):
+        first = default_storage.save("banners/a.jpg", image_file(40, 40))
+        second = default_storage.save("heros/b.JPG", image_file(40, 40))
+        self.assertEqual(first, second)
+        self.assertRegex(first, r"^cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(MediaBlob.objects.count(), 1)
+        self.assertNotEqual(default_storage.save("banners/c.jpg", image_file(41, 40)), first)
+
+        # Names from before content addressing still open as they are
+        storages["derived"].save("banners/legacy.jpg", image_file(10, 10))
+        self.assertTrue(default_storage.exists("banners/legacy.jpg"))
+        banner = Banner.objects.create(category=self.category, image="banners/legacy.jpg")
+        self.assertEqual(banner.image.size, default_storage.size("banners/legacy.jpg"))
+
+    def test_rows_are_reference_counted(self):
+        one = Banner.objects.create(category=self.category, image=ContentFile(image_file(30, 30).read(), name="x.jpg"))
+        two = Hero.objects.create(title="t", subtext="s", image=ContentFile(image_file(30, 30).read(), name="y.jpg"))
+        name = one.image.name
+        self.assertEqual(two.image.name, name)
+        self.assertEqual(self.blob(name).refcount, 2)
+
+        # Referenced blobs survive a delete through the storage
+        default_storage.delete(name)
+        self.assertTrue(default_storage.exists(name))
+
+        one.image = ContentFile(image_file(31, 30).read(), name="z.jpg")
+        one.save()
+        self.assertEqual(self.blob(name).refcount, 1)
+        self.assertEqual(self.blob(one.image.name).refcount, 1)
+        two.delete()
+        self.assertEqual(self.blob(name).refcount, 0)
+
+        MediaBlob.objects.update(refcount=7)
+        self.assertEqual(storage.recount(), 2)
+        self.assertEqual(self.blob(one.image.name).refcount, 1)
+
+    def test_dedupe_command_repoints_rows(self):
+        derived = storages["derived"]
+        derived.save("banners/a.jpg", image_file(20, 20))
+        derived.save("heros/b.jpg", image_file(20, 20))
+        derived.save(renditions.rendition_name("banners/a.jpg", 160), image_file(20, 20))
+        banner = Banner.objects.create(category=self.category, image="banners/a.jpg")
+        hero = Hero.objects.create(title="t", subtext="s", image="heros/b.jpg")
+        Hero.objects.create(title="gone", subtext="s", image="heros/missing.jpg")
+
+        out = StringIO()
+        call_command("dedupe_media", "--dry-run", stdout=out)
+        self.assertIn("2 file(s) in 1 blob(s)", out.getvalue())
+        banner.refresh_from_db()
+        self.assertEqual(banner.image.name, "banners/a.jpg")
+
+        etag = self.client.get(reverse("api_banner_list"))["ETag"]
+        call_command("dedupe_media", stdout=out)
+        self.assertIn("2 row(s) repointed, 1 missing file(s)", out.getvalue())
+        self.assertNotEqual(self.client.get(reverse("api_banner_list"))["ETag"], etag)
+        banner.refresh_from_db()
+        hero.refresh_from_db()
+        self.assertTrue(storage.is_blob(banner.image.name))
+        self.assertEqual(hero.image.name, banner.image.name)
+        self.assertEqual(self.blob(banner.image.name).refcount, 2)
+        # Old URLs keep working, without a second copy on disk
+        blob_path = default_storage.path(banner.image.name)
+        self.assertTrue(os.path.samefile(default_storage.path("heros/b.jpg"), blob_path))
+        self.assertTrue(os.path.samefile(default_storage.path("banners/a.jpg"), blob_path))
+        self.assertTrue(default_storage.exists(renditions.rendition_name(banner.image.name, 160)))
+
+        # ...and the media GC leaves them be while the blob is referenced
+        media_gc.sweep(grace=0)
+        self.assertTrue(default_storage.exists("banners/a.jpg"))
+        self.assertTrue(default_storage.exists(renditions.rendition_name("banners/a.jpg", 160)))
+        Banner.objects.all().delete()
+        Hero.objects.all().delete()
+        media_gc.sweep(grace=0, restart=True)
+        self.assertFalse(default_storage.exists("banners/a.jpg"))
+
+
+class ImageHost(BaseHTTPRequestHandler):
+    """Stand-in for a remote image host."""
+
+    hits = []
+    png = b""
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if self.path == "/slow.png":
+            time.sleep(1)
+        if self.path == "/page":
+            body, content_type = b"<html></html>", "text/html"
+        elif self.path in ("/shirt.png", "/slow.png"):
+            body, content_type = self.png, "image/png"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, ORDER_IMAGE_FETCH_TIMEOUT=(1, 0.2))
+class OrderImageIngestTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        ImageHost.hits = []
+        ImageHost.png = image_file(20, 20, "PNG").read()
+        server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHost)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base = f"http://127.0.0.1:{server.server_address[1]}"
+        self.user = AppUser.objects.create(number="+923001234567", password_hash="x")
+
+    def order(self, *paths):
+        items = [{"name": f"Item {i}", "pts": 0, "price": "10", "image": self.base + path} for i, path in enumerate(paths)]
+        hits = len(ImageHost.hits)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("create_order"), {"user_id": self.user.pk, "product": items}, content_type="application/json")
+            # Answered before any image is fetched
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(ImageHost.hits), hits)
+            self.assertEqual([item["image"] for item in response.json()["order"]["items"]], [None] * len(paths))
+        return Order.objects.get(pk=response.json()["order"]["id"])
+
+    def test_images_attached_in_background_and_fetched_once(self):
+        order = self.order("/shirt.png", "/shirt.png")
+        self.order("/shirt.png")
+        self.assertEqual(ImageHost.hits, ["/shirt.png"])
+        names = {item.image.name for item in order.items.all()}
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(name.endswith(".png"))
+        self.assertEqual(default_storage.open(name).read(), ImageHost.png)
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 3)
+
+    def test_failed_downloads_leave_item_without_image(self):
+        with self.assertLogs("app.ingest", "WARNING") as logs:
+            order = self.order("/slow.png", "/page", "/missing.png")
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(sorted(ImageHost.hits), ["/missing.png", "/page", "/slow.png"])
+        for item in order.items.all():
+            self.assertFalse(item.image)
+            self.assertTrue(item.image_url.startswith(self.base))
+
+    def test_command_attaches_images_left_pending(self):
+        # As after a restart: the order was saved, its queued download lost
+        order = Order.objects.create(user=self.user, address="Street", shipping="Standard")
+        item = OrderItem.objects.create(order=order, name="Shirt", pts=0, price=10, image_url=self.base + "/shirt.png")
+        out = StringIO()
+        call_command("attach_order_images", stdout=out)
+        self.assertIn("Checked 0 order(s)", out.getvalue())  # too recent: the queue may still have it
+
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        call_command("attach_order_images", stdout=out)
+        self.assertIn("Checked 1 order(s): attached 1 image(s), 0 still missing.", out.getvalue())
+        item.refresh_from_db()
+        self.assertEqual(default_storage.open(item.image.name).read(), ImageHost.png)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class OrderItemCatalogImageTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = AppUser.objects.create(number="+923001234567", password_hash="x")
+        category = Category.objects.create(name="Care", slug="care")
+        self.product = Product.objects.create(
+            name="Shirt", slug="shirt", category=category, regular_price=100,
+            image=ContentFile(image_file(30, 30).read(), name="shirt.jpg"),
+        )
+
+    def order(self, **item):
+        item = {"name": "Shirt", "pts": 0, "price": "10", **item}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("create_order"), {"user_id": self.user.pk, "product": [item]}, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        return OrderItem.objects.get(order_id=response.json()["order"]["id"])
+
+    def test_items_reference_catalog_image(self):
+        name = self.product.image.name
+        by_id = self.order(product_id=self.product.pk)
+        self.assertEqual((by_id.image.name, by_id.source_product), (name, self.product))
+
+        digest = name.rsplit("/", 1)[1].split(".")[0]
+        self.assertEqual(self.order(image_hash=digest).image.name, name)
+
+        # Our own media URLs (renditions too) need no download
+        url = f"http://testserver/media/{renditions.rendition_name(name, 480)}"
+        by_url = self.order(image=url)
+        self.assertEqual((by_url.image.name, by_url.image_url), (name, ""))
+
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 4)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "order_items")))
+
+    def test_own_image_url_beats_product_id(self):
+        variant = ProductVariant.objects.create(
+            product=self.product, sku="S-1", price=100, image=ContentFile(image_file(31, 31).read(), name="v.jpg"),
+        )
+        item = self.order(product_id=self.product.pk, image=f"http://testserver/media/{variant.image.name}")
+        self.assertEqual(item.image.name, variant.image.name)
+
+    def test_replaced_or_deleted_source_is_kept(self):
+        storages["derived"].save("products/main/legacy.jpg", image_file(25, 25))
+        Product.objects.filter(pk=self.product.pk).update(image="products/main/legacy.jpg")
+        item = self.order(product_id=self.product.pk)
+        self.assertEqual(item.image.name, "products/main/legacy.jpg")
+
+        self.product.refresh_from_db()
+        self.product.image = ContentFile(image_file(26, 26).read(), name="new.jpg")
+        self.product.save()
+        item.refresh_from_db()
+        # The legacy file was stored content-addressed for the item
+        self.assertTrue(storage.is_blob(item.image.name))
+        self.assertEqual(MediaBlob.objects.get(name=item.image.name).refcount, 1)
+        with default_storage.open(item.image.name) as copy, default_storage.open("products/main/legacy.jpg") as original:
+            self.assertEqual(copy.read(), original.read())
+
+        shared = self.order(product_id=self.product.pk)
+        self.product.delete()
+        shared.refresh_from_db()
+        self.assertIsNone(shared.source_product)
+        self.assertTrue(default_storage.exists(shared.image.name))
+        self.assertEqual(MediaBlob.objects.get(name=shared.image.name).refcount, 1)
+
+    def test_existing_copies_are_adopted(self):
+        copy = storages["derived"].save("order_items/copy.jpg", default_storage.open(self.product.image.name))
+        item = OrderItem.objects.create(order=Order.objects.create(user=self.user), image=copy, name="Shirt", pts=0, price=10)
+        other = OrderItem.objects.create(order=item.order, image=default_storage.save("x.jpg", image_file(9, 9)), name="Other", pts=0, price=10)
+
+        self.assertEqual(ingest.adopt_catalog_images(), 1)
+        item.refresh_from_db()
+        self.assertEqual((item.image.name, item.source_product), (self.product.image.name, self.product))
+        self.assertEqual(MediaBlob.objects.get(name=self.product.image.name).refcount, 2)
+        self.assertEqual(OrderItem.objects.get(pk=other.pk).source_product, None)
+
+
+class OrderCreateTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = AppUser.objects.create(number="+923001234567", password_hash="x")
+
+    def post(self, prices):
+        items = [{"name": f"Item {i}", "pts": 5, "price": price} for i, price in enumerate(prices)]
+        payload = {"user_id": self.user.pk, "product": items, "payment": [{"method": "COD", "status": "Pending"}]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("create_order"), payload, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.get(pk=response.json()["order"]["id"]), len(queries)
+
+    def test_queries_do_not_grow_with_items(self):
+        order, few = self.post(["10"] * 2)
+        bigger, many = self.post(["10"] * 50)
+        self.assertEqual(few, many)
+        self.assertEqual((bigger.items.count(), bigger.payments.count()), (50, 1))
+
+    def test_type_set_once(self):
+        self.assertEqual(self.post(["0", "0.00"])[0].type, "redeem")
+        self.assertEqual(self.post(["0", "10"])[0].type, "normal")
+        self.assertEqual(self.post([])[0].type, "normal")
+
+    def test_single_saves_still_update_type(self):
+        order, _ = self.post(["0"])
+        OrderItem.objects.create(order=order, name="Paid", pts=0, price=10)
+        order.refresh_from_db()
+        self.assertEqual(order.type, "normal")
+
+    def test_bulk_items_count_blob_references(self):
+        encoded = base64.b64encode(image_file(12, 12, "PNG").read()).decode()
+        item = {"name": "Photo", "pts": 0, "price": "10", "image": f"data:image/png;base64,{encoded}"}
+        response = self.client.post(
+            reverse("create_order"), {"user_id": self.user.pk, "product": [item, item]}, content_type="application/json",
+        )
+        names = {item.image.name for item in OrderItem.objects.filter(order_id=response.json()["order"]["id"])}
+        self.assertEqual(len(names), 1)
+        self.assertEqual(MediaBlob.objects.get(name=names.pop()).refcount, 2)
+
+    def test_malformed_data_url_is_skipped(self):
+        item = {"name": "Photo", "pts": 0, "price": "10", "image": "data:image/png,not-base64"}
+        response = self.client.post(
+            reverse("create_order"), {"user_id": self.user.pk, "product": [item]}, content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(OrderItem.objects.get().image)
+
+
+class UploadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.partials = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.partials, ignore_errors=True)
+        settings_override = override_settings(CHUNKED_UPLOAD_DIR=self.partials)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        category = Category.objects.create(name="Care", slug="care")
+        self.product = Product.objects.create(name="Shirt", slug="shirt", category=category, regular_price=100)
+        self.client.force_login(User.objects.create_user("admin", password="x"))
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1000)
+    def test_base64_is_decoded_to_disk(self):
+        payload = os.urandom(5001)
+        encoded = base64.encodebytes(payload).decode()  # with newlines
+        decoded = uploads.decode_base64(encoded, "a.bin")
+        self.assertEqual(decoded.read(), payload)
+        self.assertTrue(decoded.file._rolled)
+        self.assertEqual(uploads.decode_base64(base64.b64encode(b"ab").decode().rstrip("="), "b").read(), b"ab")
+        with self.assertRaises(ValueError):
+            uploads.decode_base64("abc!d", "c")
+        url = "data:image/png;base64," + base64.b64encode(payload).decode()
+        self.assertEqual(uploads.decode_base64(url, "d", start=len("data:image/png;base64,")).read(), payload)
+
+    def put(self, upload_id, body, first, size):
+        return self.client.put(
+            reverse("gallery_upload", args=[upload_id]), body, content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {first}-{first + len(body) - 1}/{size}",
+        )
+
+    def test_resumable_gallery_upload(self):
+        content = image_file(300, 200, "PNG").read()
+        size, half = len(content), len(content) // 2
+        response = self.client.post(reverse("gallery_upload_start", args=[self.product.pk]), {"filename": "g.png", "size": size})
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()["id"]
+
+        self.assertEqual(self.put(upload_id, content[:half], 0, size).json()["offset"], half)
+        # A chunk from the wrong place is refused with the offset to resume from
+        conflict = self.put(upload_id, content[:10], 0, size)
+        self.assertEqual((conflict.status_code, conflict.json()["offset"]), (409, half))
+        self.assertEqual(self.client.get(reverse("gallery_upload", args=[upload_id])).json()["offset"], half)
+
+        done = self.put(upload_id, content[half:], half, size)
+        self.assertEqual(done.status_code, 201)
+        gallery_image = ProductImage.objects.get(pk=done.json()["id"])
+        self.assertEqual(gallery_image.product, self.product)
+        self.assertEqual(gallery_image.image.read(), content)
+        self.assertEqual(os.listdir(self.partials), [])
+        self.assertEqual(self.client.get(reverse("gallery_upload", args=[upload_id])).status_code, 404)
+
+    def test_upload_must_be_an_image(self):
+        response = self.client.post(reverse("gallery_upload_start", args=[self.product.pk]), {"filename": "x.png", "size": 4})
+        self.assertEqual(self.put(response.json()["id"], b"nope", 0, 4).status_code, 400)
+        self.assertFalse(ProductImage.objects.exists())
+        self.assertEqual(os.listdir(self.partials), [])
+
+    def test_decompression_bomb_is_discarded(self):
+        content = image_file(300, 200, "PNG").read()
+        response = self.client.post(reverse("gallery_upload_start", args=[self.product.pk]), {"filename": "b.png", "size": len(content)})
+        upload_id = response.json()["id"]
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            response = self.put(upload_id, content, 0, len(content))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ProductImage.objects.exists())
+        self.assertEqual(os.listdir(self.partials), [])
+        self.assertEqual(self.client.get(reverse("gallery_upload", args=[upload_id])).status_code, 404)
+
+
+class MediaServingTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = image_file(64, 64, "PNG").read()
+        self.blob = default_storage.save("banners/b.png", ContentFile(self.content))
+        storages["derived"].save("banners/legacy.png", ContentFile(self.content))
+
+    def get(self, name, **headers):
+        return self.client.get(f"/media/{name}", HTTP_ACCEPT_ENCODING="gzip, br", **headers)
+
+    def test_caching_headers_and_304(self):
+        response = self.get(self.blob)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertNotIn("Content-Encoding", response)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+        self.assertNotIn("immutable", self.get("banners/legacy.png")["Cache-Control"])
+        self.assertIn("immutable", self.client.get(f"/media/renditions/160/{self.blob}")["Cache-Control"])
+
+        cached = self.get(self.blob, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        self.assertIn("immutable", cached["Cache-Control"])
+        self.assertEqual(self.get(self.blob, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+    def test_range_requests(self):
+        response = self.get(self.blob, HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 0-9/{len(self.content)}")
+        self.assertEqual(b"".join(response.streaming_content), self.content[:10])
+        self.assertEqual(b"".join(self.get(self.blob, HTTP_RANGE="bytes=-5").streaming_content), self.content[-5:])
+        self.assertEqual(b"".join(self.get(self.blob, HTTP_RANGE="bytes=20-").streaming_content), self.content[20:])
+
+        unsatisfiable = self.get(self.blob, HTTP_RANGE=f"bytes={len(self.content)}-")
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable["Content-Range"]), (416, f"bytes */{len(self.content)}"))
+        # A stale If-Range gets the whole (changed) file
+        self.assertEqual(self.get(self.blob, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"old"').status_code, 200)
+
+    @override_settings(MEDIA_ACCEL="x-accel-redirect")
+    def test_hands_off_to_nginx(self):
+        response = self.get(self.blob)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("immutable", response["Cache-Control"])
+        # What nginx does with it: "location /protected-media/ { internal; alias MEDIA_ROOT/; }"
+        location = response["X-Accel-Redirect"]
+        self.assertTrue(location.startswith("/protected-media/"))
+        with open(os.path.join(self.media_root, location[len("/protected-media/"):]), "rb") as served:
+            self.assertEqual(served.read(), self.content)
+
+    @override_settings(MEDIA_ACCEL="x-sendfile")
+    def test_hands_off_to_sendfile(self):
+        response = self.get("banners/legacy.png")
+        self.assertEqual(response["X-Sendfile"], os.path.join(self.media_root, "banners", "legacy.png"))
+        self.assertEqual(response.content, b"")
+
+
+class MediaGCTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        derived = storages["derived"]
+        category = Category.objects.create(name="Care", slug="care")
+        self.kept = Banner.objects.create(category=category, image=ContentFile(image_file(10, 10).read(), name="k.jpg")).image.name
+        derived.save(renditions.rendition_name(self.kept, 160), image_file(10, 10))
+        derived.save(self.kept + ".webp", image_file(10, 10))
+        self.orphans = [
+            derived.save("ads/gone.jpg", image_file(11, 11)),
+            derived.save(renditions.rendition_name("ads/gone.jpg", 480), image_file(11, 11)),
+            default_storage.save("x.jpg", image_file(12, 12)),
+        ]
+        self.fresh = derived.save("ads/new.jpg", image_file(13, 13))
+        old = time.time() - 2 * 24 * 3600
+        for name in [self.kept, *self.orphans]:
+            os.utime(default_storage.path(name), (old, old))
+        MediaBlob.objects.update(updated_at=timezone.now() - timedelta(days=2))
+
+    def exists(self):
+        return {name: default_storage.exists(name) for name in [self.kept, *self.orphans, self.fresh]}
+
+    def test_dry_run_then_sweep(self):
+        out = StringIO()
+        call_command("gc_media", "--dry-run", stdout=out)
+        self.assertIn("Scanned 7 file(s): 3 referenced, 1 within the grace period, 3 unreferenced would be deleted", out.getvalue())
+        self.assertTrue(all(self.exists().values()))
+
+        call_command("gc_media", stdout=out)
+        self.assertEqual(self.exists(), {
+            self.kept: True, self.orphans[0]: False, self.orphans[1]: False, self.orphans[2]: False, self.fresh: True,
+        })
+        self.assertTrue(default_storage.exists(renditions.rendition_name(self.kept, 160)))
+        self.assertEqual(list(MediaBlob.objects.values_list("name", flat=True)), [self.kept])
+        # Directories emptied by the sweep are gone too
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "renditions", "480")))
+
+    def test_resumes_where_it_stopped(self):
+        seen = []
+        while True:
+            stats = media_gc.sweep(limit=2, batch_size=1)
+            seen.append(stats["scanned"])
+            if stats["finished"]:
+                break
+            self.assertNotEqual(MediaSweep.objects.get().cursor, "")
+        self.assertEqual(sum(seen), 7)
+        self.assertEqual(MediaSweep.objects.get().cursor, "")
+        self.assertFalse(any(self.exists()[name] for name in self.orphans))
+
+    def test_reused_blob_is_within_grace(self):
+        # Same content as the old orphan blob: the row referencing it isn't committed yet
+        self.assertEqual(default_storage.save("y.jpg", image_file(12, 12)), self.orphans[2])
+        stats = media_gc.sweep()
+        self.assertTrue(default_storage.exists(self.orphans[2]))
+        self.assertEqual(stats["recent"], 2)
+        # Marked through the access time; the mtime renditions go by is kept
+        self.assertLess(os.path.getmtime(default_storage.path(self.orphans[2])), time.time() - 3600)
+
+    def test_file_named_like_a_sidecar_is_kept(self):
+        name = storages["derived"].save("redeem/photo.v2.webp", image_file(14, 14, "WEBP"))
+        old = time.time() - 2 * 24 * 3600
+        os.utime(default_storage.path(name), (old, old))
+        Redeem.objects.create(subtitle="s", title="t", description="d", image=name)
+        media_gc.sweep(grace=0)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_walk_order_and_cursor(self):
+        names = list(media_gc.walk(self.media_root))
+        self.assertEqual(names, sorted(names, key=lambda name: name.split("/")))
+        self.assertEqual(list(media_gc.walk(self.media_root, names[2])), names[3:])
+
+
+class PlaceholderTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name="Care", slug="care")
+
+    def test_dimensions_and_placeholder_on_save(self):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # stored landscape, displayed portrait
+        Image.new("RGB", (300, 200), "blue").save(buffer, "JPEG", exif=exif)
+        banner = Banner.objects.create(category=self.category, image=ContentFile(buffer.getvalue(), name="b.jpg"))
+        self.assertEqual((banner.image_width, banner.image_height), (200, 300))
+
+        data = BannerSerializer(banner).data
+        self.assertEqual((data["image_width"], data["image_height"]), (200, 300))
+        prefix = "data:image/jpeg;base64,"
+        self.assertTrue(data["image_placeholder"].startswith(prefix))
+        self.assertLess(len(data["image_placeholder"]), 1024)
+        thumbnail = Image.open(io.BytesIO(base64.b64decode(data["image_placeholder"][len(prefix):])))
+        self.assertEqual(thumbnail.size, (11, 16))
+
+        banner.refresh_from_db()
+        self.assertEqual(banner.image_placeholder, data["image_placeholder"])
+        banner.image = ContentFile(image_file(40, 10, "PNG").read(), name="c.png")
+        banner.save()
+        self.assertEqual((banner.image_width, banner.image_height), (40, 10))
+        banner.image = None
+        banner.save()
+        banner.refresh_from_db()
+        self.assertEqual((banner.image_width, banner.image_placeholder), (None, ""))
+
+    def test_backfill(self):
+        product = Product.objects.create(
+            name="Shirt", slug="shirt", category=self.category, image=ContentFile(image_file(64, 32).read(), name="s.jpg"),
+        )
+        Hero.objects.create(title="t", subtext="s", image="heros/missing.jpg")
+        Product.objects.update(image_width=None, image_height=None, image_placeholder="")
+        self.assertEqual(placeholders.backfill(Product), 1)
+        product.refresh_from_db()
+        self.assertEqual((product.image_width, product.image_height), (64, 32))
+        self.assertTrue(product.image_placeholder)
+        self.assertEqual(ProductSerializer(product).data["image_width"], 64)
+        # Unreadable files are left empty rather than failing
+        self.assertEqual(placeholders.backfill(Hero), 1)
+        self.assertIsNone(Hero.objects.get().image_width)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class PlaceholderSnapshotTests(TemporaryMediaRoot, TransactionTestCase):
+    """Saves outside atomic(): the snapshot rebuild runs straight away."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_section_snapshot_sees_placeholder(self):
+        url = reverse("api_category_list")
+        self.client.get(url)
+        Category(name="Care", slug="care", image=ContentFile(image_file(40, 20).read(), name="c.jpg")).save()
+        data = self.client.get(url).json()
+        rows = data["results"] if isinstance(data, dict) else data
+        self.assertEqual((rows[0]["image_width"], rows[0]["image_height"]), (40, 20))
+        self.assertTrue(rows[0]["image_placeholder"])
@@ -0,0 +1,132 @@
+import binascii
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import GalleryUpload, ProductImage
+
+# Base64 characters decoded per step; a multiple of 4 so no group is split
+DECODE_CHUNK = 256 * 1024
+COPY_CHUNK = 64 * 1024
+
+
+def spooled_file():
+    """Temp file kept in memory up to FILE_UPLOAD_MAX_MEMORY_SIZE, on disk past it."""
+    return tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, dir=settings.FILE_UPLOAD_TEMP_DIR)
+
+
+def decode_base64(data, name, start=0):
+    """Decode a base64 string, from offset ``start``, into a spooled temp file, one slice at a time.
+
+    Unlike ``base64.b64decode`` this never holds a second full copy of the
+    payload; pass ``start`` rather than slicing off a prefix such as a data:
+    URL header. Returns a File called ``name``; raises ValueError if ``data``
+    isn't base64.
+    """
+    spool = spooled_file()
+    carry = ""
+    try:
+        for offset in range(start, len(data), DECODE_CHUNK):
+            piece = carry + "".join(data[offset:offset + DECODE_CHUNK].split())
+            cut = len(piece) - len(piece) % 4
+            spool.write(binascii.a2b_base64(piece[:cut]))
+            carry = piece[cut:]
+        if carry:
+            spool.write(binascii.a2b_base64(carry + "=" * (-len(carry) % 4)))
+    except binascii.Error as exc:
+        spool.close()
+        raise ValueError(f"Invalid base64 data: {exc}") from exc
+    spool.seek(0)
+    return File(spool, name=name)
+
+
+# Resumable gallery uploads
+
+class OffsetMismatch(ValueError):
+    """A chunk doesn't start where the upload left off."""
+
+
+def upload_dir():
+    return str(getattr(settings, "CHUNKED_UPLOAD_DIR", None) or os.path.join(tempfile.gettempdir(), "dkt-uploads"))
+
+
+def partial_path(upload):
+    return os.path.join(upload_dir(), str(upload.pk))
+
+
+def discard(upload):
+    if os.path.exists(partial_path(upload)):
+        os.remove(partial_path(upload))
+    upload.delete()
+
+
+def purge_stale():
+    """Drop uploads nobody has resumed within CHUNKED_UPLOAD_EXPIRY."""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, "CHUNKED_UPLOAD_EXPIRY", 60 * 60 * 24))
+    for upload in GalleryUpload.objects.filter(updated_at__lt=cutoff):
+        discard(upload)
+
+
+def start(product, filename, size):
+    """New upload of ``size`` bytes for ``product``'s gallery."""
+    limit = getattr(settings, "GALLERY_UPLOAD_MAX_BYTES", 50 * 1024 * 1024)
+    if not 0 < size <= limit:
+        raise ValueError(f"Size must be between 1 and {limit} bytes.")
+    purge_stale()
+    upload = GalleryUpload.objects.create(product=product, filename=os.path.basename(filename)[:255] or "upload", size=size)
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(partial_path(upload), "wb").close()
+    return upload
+
+
+def append(upload_id, offset, stream, length):
+    """Write ``length`` bytes from ``stream`` at ``offset``; returns the updated upload.
+
+    Whatever arrives before the client disconnects is kept, so it can
+    resume from ``upload.received``.
+    """
+    with transaction.atomic():
+        upload = GalleryUpload.objects.select_for_update().get(pk=upload_id)
+        if offset != upload.received:
+            raise OffsetMismatch(upload.received)
+        if offset + length > upload.size:
+            raise ValueError("Chunk runs past the declared size.")
+        written = 0
+        with open(partial_path(upload), "r+b") as partial:
+            partial.seek(offset)
+            try:
+                while written < length:
+                    piece = stream.read(min(COPY_CHUNK, length - written))
+                    if not piece:
+                        break
+                    partial.write(piece)
+                    written += len(piece)
+            finally:
+                partial.truncate(offset + written)
+                upload.received = offset + written
+                upload.save(update_fields=["received", "updated_at"])
+    return upload
+
+
+def finish(upload):
+    """Turn a complete upload into a ProductImage and drop the partial file."""
+    path = partial_path(upload)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except (OSError, SyntaxError) as exc:
+        discard(upload)
+        raise ValueError("The upload is not an image.") from exc
+    except Image.DecompressionBombError as exc:
+        discard(upload)
+        raise ValueError("The upload has too many pixels.") from exc
+    with open(path, "rb") as content:
+        gallery_image = ProductImage.objects.create(product=upload.product, image=File(content, name=upload.filename))
+    discard(upload)
+    return gallery_image
@@ -0,0 +1,93 @@
+from rest_framework.exceptions import ValidationError
+
+from .models import ProductVariant, VariantOption, VariantValue
+from .serializers import ProductVariantSerializer
+
+
+def combination_key(value_ids):
+    """Normalized key for a set of VariantValue ids: sorted and dash-joined."""
+    return "-".join(str(value_id) for value_id in sorted({int(value_id) for value_id in value_ids}))
+
+
+def parse_key(key):
+    return {int(value_id) for value_id in key.split("-") if value_id}
+
+
+class OptionIndex:
+    """A product's options and values, loaded once, for keying its variants."""
+
+    def __init__(self, product):
+        self.product = product
+        self.options = {option.name: option for option in VariantOption.objects.filter(product=product)}
+        self.values = {
+            (value.option.name, value.value): value.pk
+            for value in VariantValue.objects.filter(option__product=product).select_related("option")
+        }
+
+    def key(self, options):
+        """Combination key for an ``{"Color": "Red", ...}`` dict, creating missing options/values."""
+        value_ids = []
+        for name, value in (options or {}).items():
+            name, value = str(name).strip(), str(value).strip()
+            if not name or not value:
+                continue
+            if (name, value) not in self.values:
+                if name not in self.options:
+                    self.options[name] = VariantOption.objects.create(product=self.product, name=name)
+                self.values[(name, value)] = VariantValue.objects.create(option=self.options[name], value=value).pk
+            value_ids.append(self.values[(name, value)])
+        return combination_key(value_ids)
+
+    def prune(self):
+        """Drop values no variant uses any more, then options left without values."""
+        used = set()
+        for key in ProductVariant.objects.filter(product=self.product).values_list("combination_key", flat=True):
+            used |= parse_key(key)
+        VariantValue.objects.filter(option__product=self.product).exclude(pk__in=used).delete()
+        VariantOption.objects.filter(product=self.product, values__isnull=True).delete()
+
+
+def _selected_values(request):
+    try:
+        return {int(value) for value in request.query_params.get("values", "").split(",") if value.strip()}
+    except ValueError:
+        raise ValidationError({"values": "Enter a comma-separated list of option value ids."})
+
+
+def build_resolve(request, product_id):
+    """Variant for the selected option values plus the values still available.
+
+    A value is available if some in-stock variant has it together with the
+    rest of the selection (ignoring the current pick for its own option).
+    """
+    selected = _selected_values(request)
+    option_of = dict(VariantValue.objects.filter(option__product_id=product_id).values_list("id", "option_id"))
+    if selected - option_of.keys():
+        raise ValidationError({"values": "Unknown option value for this product."})
+    picked = {}
+    for value_id in selected:
+        if option_of[value_id] in picked:
+            raise ValidationError({"values": "Choose at most one value per option."})
+        picked[option_of[value_id]] = value_id
+
+    variant = None
+    if selected:
+        match = ProductVariant.objects.filter(product_id=product_id, combination_key=combination_key(selected)).first()
+        if match is not None:
+            variant = ProductVariantSerializer(match, context={"request": request}).data
+
+    in_stock = [
+        parse_key(key)
+        for key in ProductVariant.objects.filter(product_id=product_id, stock__gt=0).values_list("combination_key", flat=True)
+    ]
+    available = {}
+    for value_id, option_id in sorted(option_of.items()):
+        wanted = {picked_id for picked_option, picked_id in picked.items() if picked_option != option_id} | {value_id}
+        if any(wanted <= combination for combination in in_stock):
+            available.setdefault(option_id, []).append(value_id)
+
+    return {
+        "values": sorted(selected),
+        "variant": variant,
+        "available": [{"option": option_id, "values": values} for option_id, values in sorted(available.items())],
+    }
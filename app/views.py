@@ -3,6 +3,7 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 import json
+import re
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from twilio.rest import Client
@@ -10,9 +11,17 @@ from django.contrib.auth.hashers import make_password
 from django.utils.crypto import get_random_string
 from django.conf import settings
 from collections import defaultdict
+from decimal import Decimal, InvalidOperation
 from django.db import IntegrityError, transaction
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_http_methods
+from PIL import Image
+from . import media, orders, renditions, search, uploads
+from .tasks import run_in_background
+from .variants import OptionIndex
 from .forms import CategoryForm, BrandForm, BannerForm, ProductForm, RedeemForm, AdForm, HeroForm, DiscountForm
-from .models import Product, Redeem, ProductVariant, Category, Brand, ProductImage, Banner, Ad, Hero, Order, OrderItem, Payment, AppUser, Address, Discount
+from .models import Product, Redeem, ProductVariant, Category, Brand, ProductImage, Banner, Ad, Hero, Order, OrderItem, Payment, AppUser, Address, Discount, GalleryUpload
 
 client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
 
@@ -154,9 +163,9 @@ def customer_detail(request, pk):
 
     # Details orders
     addresses = Address.objects.filter(user=user)
-    orders = Order.objects.filter(status="delivered", user=user)
-    normal_orders = orders.filter(type="normal")
-    redeem_orders = orders.filter(type="redeem")
+    delivered = Order.objects.filter(status="delivered", user=user)
+    normal_orders = delivered.filter(type="normal")
+    redeem_orders = delivered.filter(type="redeem")
 
     normal_orders_data = []
     redeem_orders_data = []
@@ -316,14 +325,6 @@ def create_order_ui(request):
         shipping = request.POST.get("shipping")
         status = request.POST.get("status", "pending")
 
-        # Create order
-        order = Order.objects.create(
-            user_id=user_id,
-            address=address,
-            shipping=shipping,
-            status=status
-        )
-
         # Parse Order Items
         items = {}
         for key, value in request.POST.items():
@@ -334,18 +335,23 @@ def create_order_ui(request):
                     items[index] = {}
                 items[index][field] = value
 
-        # Save items
-        for idx, item in items.items():   
-            if item.get("name"):  
-                image = request.FILES.get(f"items[{idx}][image]")  
-                OrderItem.objects.create(
-                    order=order,
-                    image=image,
+        # Create order with its items (bulk inserted, order written once)
+        orders.create(
+            [
+                OrderItem(
+                    image=request.FILES.get(f"items[{idx}][image]"),
                     name=item.get("name"),
                     pts=item.get("pts") or 0,
                     variants=item.get("variants") or "",
                     price=item.get("price") or 0
                 )
+                for idx, item in items.items() if item.get("name")
+            ],
+            user_id=user_id,
+            address=address,
+            shipping=shipping,
+            status=status
+        )
 
         return redirect("order_list_ui")
 
@@ -373,15 +379,43 @@ def delete_order_ui(request, pk):
 
 
 
+def parse_number(value, whole=False):
+    """A non-negative number typed into a variant field; None when blank.
+
+    Raises ValueError for anything else ("Rs 15", "-1", or "2.5" where
+    ``whole`` asks for a count).
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(value)
+    # Bounded like the DecimalFields (max_digits=10, decimal_places=2)
+    if not number.is_finite() or not 0 <= number < 10 ** 8 or (whole and number != number.to_integral_value()):
+        raise ValueError(value)
+    return int(number) if whole else number.quantize(Decimal("0.01"))
+
+
+VARIANT_NUMBERS = (
+    ("regular_price", "regular price", False),
+    ("sale_price", "sale price", False),
+    ("stock", "stock", True),
+    ("points", "points", True),
+)
+
+
+class InvalidVariants(Exception):
+    """Raised by handle_product_variants once the form errors are in messages."""
+
+
 def handle_product_variants(product, request, pk=None):
     """Save product variants if product_type == variable"""
     if request.POST.get("product_type") != "variable":
         return
 
-    # Purge old variants on edit
-    if pk:
-        product.variants.all().delete()
-
+    options_index = OptionIndex(product)
     variants = defaultdict(dict)
 
     # collect POST fields
@@ -398,6 +432,24 @@ def handle_product_variants(product, request, pk=None):
             field = key.split("[")[2].split("]")[0]
             variants[idx][field] = file
 
+    # Check the numbers before anything is written
+    numbers, invalid = {}, False
+    for position, (idx, data) in enumerate(variants.items(), 1):
+        numbers[idx] = {}
+        for field, label, whole in VARIANT_NUMBERS:
+            try:
+                numbers[idx][field] = parse_number(data.get(field), whole)
+            except ValueError:
+                invalid = True
+                kind = "a whole number" if whole else "a number"
+                messages.error(request, f"Variant {position}: {label} must be {kind} of 0 or more, not \"{data[field]}\".")
+    if invalid:
+        raise InvalidVariants
+
+    # Purge old variants on edit
+    if pk:
+        product.variants.all().delete()
+
     # save each variant
     for idx, data in variants.items():
         # parse options json if present
@@ -408,20 +460,17 @@ def handle_product_variants(product, request, pk=None):
             except Exception:
                 options = {}
 
-        attributes = {
-            "options": options,
-            "sale_price": data.get("sale_price"),
-            "points": data.get("points"),
-            "description": data.get("description"),
-        }
-
         try:
             variant = ProductVariant.objects.create(
                 product=product,
                 sku=data.get("sku") or None,
-                price=data.get("regular_price") or 0,
-                stock=data.get("stock") or 0,
-                attributes=attributes,
+                price=numbers[idx]["regular_price"] or 0,
+                sale_price=numbers[idx]["sale_price"],
+                stock=numbers[idx]["stock"] or 0,
+                points=numbers[idx]["points"],
+                description=data.get("description"),
+                attributes={"options": options},
+                combination_key=options_index.key(options),
             )
 
             uploaded_image = request.FILES.get(f"variants[{idx}][image]")
@@ -437,6 +486,9 @@ def handle_product_variants(product, request, pk=None):
             messages.error(request, f"Duplicate SKU: {data.get('sku')}. Please use a unique SKU.")
             raise
 
+    # Drop option values no variant uses any more
+    options_index.prune()
+
 
 # ----------------------------
 #  Main View
@@ -449,27 +501,31 @@ def add_or_edit_product(request, pk=None):
     if request.method == "POST":
         form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
-            with transaction.atomic():
-                product = form.save()
-
-                 # Save gallery images
-                gallery_images = request.FILES.getlist("gallery_images")
-                print("DEBUG → request.FILES keys:", request.FILES.keys())
-                print("DEBUG → gallery_images list:", request.FILES.getlist("gallery_images"))
-                if gallery_images:
-                        for img in gallery_images:
-                            ProductImage.objects.create(product=product, image=img)
-
-
-                # Handle variants
-                handle_product_variants(product, request, pk)
-
-                #  Success message
-                messages.success(
-                    request,
-                    f"Product '{product.name}' {'updated' if pk else 'created'} successfully!"
-                )
-                return redirect("product")
+            try:
+                with transaction.atomic():
+                    product = form.save()
+
+                     # Save gallery images
+                    gallery_images = request.FILES.getlist("gallery_images")
+                    print("DEBUG → request.FILES keys:", request.FILES.keys())
+                    print("DEBUG → gallery_images list:", request.FILES.getlist("gallery_images"))
+                    if gallery_images:
+                            for img in gallery_images:
+                                ProductImage.objects.create(product=product, image=img)
+
+
+                    # Handle variants
+                    handle_product_variants(product, request, pk)
+
+                    #  Success message
+                    messages.success(
+                        request,
+                        f"Product '{product.name}' {'updated' if pk else 'created'} successfully!"
+                    )
+                    return redirect("product")
+            except (InvalidVariants, IntegrityError):
+                # Rolled back; the messages say what to fix
+                product = get_object_or_404(Product, pk=pk) if pk else None
         else:
             messages.error(request, "Please correct the errors below.")
     else:
@@ -498,9 +554,9 @@ def product(request):
     search_query = request.GET.get('q', '')
 
     if search_query:
-        products = Product.objects.filter(name__icontains=search_query).order_by('-id')
+        products = search.search_products(search_query, Product.objects.select_related("category", "brand"))
     else:
-        products = Product.objects.all().order_by('-id')
+        products = Product.objects.select_related("category", "brand").order_by('-id')
 
     categories = Category.objects.all().order_by('-id')
 
@@ -896,4 +952,73 @@ def send_discount_email(discount):
 #   .lookBook__container {
 #     flex-direction: column-reverse;
 #   }
-# } 
\ No newline at end of file
+# } 
+
+
+# Uploaded media, as WebP/AVIF when the client accepts a smaller encoding
+def media_file(request, name):
+    return media.serve(request, name)
+
+
+# Renditions not generated yet (new upload, new width) are built on first request
+def media_rendition(request, width, name):
+    if width not in renditions.widths() or not renditions.supported(name):
+        raise Http404("No such rendition.")
+    target = renditions.rendition_name(name, width)
+    if not default_storage.exists(target):
+        try:
+            renditions.generate(name, sidecars=False)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            raise Http404("No such rendition.")
+        # WebP/AVIF encodings are left to a background task
+        run_in_background(renditions.generate, name)
+    return media.serve(request, target)
+
+
+# Resumable gallery uploads: POST {filename, size} starts one, then each PUT
+# sends raw bytes with "Content-Range: bytes <first>-<last>/<size>". A GET
+# tells a client that lost its connection where to resume.
+def _upload_state(upload):
+    return {"id": str(upload.pk), "offset": upload.received, "size": upload.size}
+
+
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def gallery_upload_start(request, pk):
+    product = get_object_or_404(Product, pk=pk)
+    try:
+        size = int(request.POST.get("size", ""))
+        upload = uploads.start(product, request.POST.get("filename", ""), size)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+@login_required(login_url='login')
+@require_http_methods(["GET", "PUT", "DELETE"])
+def gallery_upload(request, upload_id):
+    upload = get_object_or_404(GalleryUpload, pk=upload_id)
+    if request.method == "GET":
+        return JsonResponse(_upload_state(upload))
+    if request.method == "DELETE":
+        uploads.discard(upload)
+        return HttpResponse(status=204)
+
+    match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", request.headers.get("Content-Range", "").strip())
+    if not match or int(match[3]) != upload.size or int(match[2]) < int(match[1]):
+        return JsonResponse({"error": "Send Content-Range: bytes <first>-<last>/<size>."}, status=400)
+    first, last = int(match[1]), int(match[2])
+    try:
+        upload = uploads.append(upload.pk, first, request, last - first + 1)
+    except uploads.OffsetMismatch:
+        upload.refresh_from_db()
+        return JsonResponse({"error": "Resume from offset.", **_upload_state(upload)}, status=409)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    if upload.received < upload.size:
+        return JsonResponse(_upload_state(upload))
+    try:
+        gallery_image = uploads.finish(upload)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    return JsonResponse({"id": gallery_image.pk, "image": gallery_image.image.url}, status=201)
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,7 +78,13 @@ TEMPLATES = [
 WSGI_APPLICATION = 'dkt_app.wsgi.application'
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  
-FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  
+# Uploaded files past this are spooled to a temp file instead of kept in RAM
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+
+# Resumable gallery uploads (app/uploads.py); CHUNKED_UPLOAD_DIR defaults to <tempdir>/dkt-uploads
+CHUNKED_UPLOAD_DIR = None
+CHUNKED_UPLOAD_EXPIRY = 60 * 60 * 24
+GALLERY_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
 
 
 LOGIN_REDIRECT_URL = '/dashboard/'   
@@ -93,6 +100,16 @@ DATABASES = {
     }
 }
 
+# Cache
+# Catalog snapshots live here; use a shared backend (Redis/Memcached) when
+# running more than one worker process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
 
 
 
@@ -133,6 +150,14 @@ USE_TZ = True
 MEDIA_URL  = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are content-addressed (app/storage.py); derived files such as
+# renditions need their exact names, so they use a plain storage on the same root.
+STORAGES = {
+    "default": {"BACKEND": "app.storage.ContentAddressedStorage"},
+    "derived": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 
 # settings.py
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -155,3 +180,49 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 APPEND_SLASH = False
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Rows serialized per chunk when streaming large lists (app/streaming.py)
+API_STREAM_CHUNK_SIZE = 500
+
+# Media serving (app/media.py). MEDIA_ACCEL hands file bodies to the front
+# proxy: "x-accel-redirect" for nginx (an internal location at
+# MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or "x-sendfile" for Apache/lighttpd.
+MEDIA_ACCEL = None
+MEDIA_ACCEL_PREFIX = "/protected-media/"
+MEDIA_CACHE_MAX_AGE = 60 * 60
+# Content-addressed names (cas/...) and their renditions never change
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Media garbage collection (app/media_gc.py), e.g. hourly from cron:
+#   python manage.py gc_media --limit 20000
+MEDIA_GC_GRACE = 60 * 60 * 24  # never delete files younger than this (seconds)
+
+# Widths of the image renditions (app/renditions.py)
+IMAGE_RENDITION_WIDTHS = (160, 480, 1080)
+# Encodings written beside every image, if Pillow supports them
+IMAGE_SIDECAR_FORMATS = ("webp", "avif")
+
+# Background tasks (app/tasks.py)
+BACKGROUND_TASK_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False
+# Workers per named queue; queues not listed get BACKGROUND_TASK_WORKERS
+BACKGROUND_TASK_QUEUES = {"images": 4}
+
+# Order item image downloads (app/ingest.py)
+ORDER_IMAGE_FETCH_TIMEOUT = (3.05, 10)  # connect, read (seconds)
+ORDER_IMAGE_FETCH_DEADLINE = 30  # whole download
+ORDER_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+ORDER_IMAGE_URL_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Catalog snapshots (app/snapshots.py)
+CATALOG_SNAPSHOT_GZIP = True
+CATALOG_SNAPSHOT_BROTLI = True  # only if the brotli package is installed
+# Finite: with a per-process cache (LocMem) the other workers only see an
+# edit once their copy expires
+CATALOG_SNAPSHOT_TIMEOUT = 60 * 5
@@ -1,9 +1,8 @@
 from django.contrib import admin
 from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from app import views, api_view
+from app import views, api_view, renditions
 
 
 urlpatterns = [
@@ -43,6 +42,8 @@ urlpatterns = [
     path("product/add/", views.add_or_edit_product, name="add_product"),
     path('product/<int:pk>/edit/', views.add_or_edit_product, name='edit_product'),
     path("products/delete/<int:pk>/", views.delete_product, name="delete_product"),
+    path("product/<int:pk>/gallery/uploads/", views.gallery_upload_start, name="gallery_upload_start"),
+    path("product/gallery/uploads/<uuid:upload_id>/", views.gallery_upload, name="gallery_upload"),
 
 
 # Redeem Route
@@ -86,12 +87,14 @@ urlpatterns = [
 # ->orderByRaw('(product_images.src IS NOT NULL AND products.regular_price IS NOT NULL) DESC')
 #             ->orderBy('products.regular_price', 'asc')
 # API
+    path('api/home/', api_view.home_feed_api, name='api_home_feed'),
     path('api/categories/', api_view.category_list_api, name='api_category_list'),
     path('api/brands/', api_view.brand_list_api, name='api_brand_list'),
     path('api/banners/', api_view.banner_list_api, name='api_banner_list'),
     path('api/ads/', api_view.ad_list_api, name='api_ad_list'),
     path('api/heros/', api_view.hero_list_api, name='api_hero_list'),
     path("api/products/", api_view.product_list_api, name="product-list-api"),
+    path("api/products/search/", api_view.product_search_api, name="product-search-api"),
     path("api/redeems/", api_view.redeem_list_api, name="redeem-list-api"),
     path("api/discounts/", api_view.validate_discount_api, name="validate-discount-api"),
     # path("api/send-otp/", api_view.send_otp, name="send-otp"),
@@ -106,10 +109,13 @@ urlpatterns = [
     path("api/account-delete/<int:pk>/", api_view.account_delete, name="account_delete"),
     path("api/app-user/list/", api_view.app_user_list, name="app_user_list"),
     path('api/app-user/login/', api_view.app_user_login, name='app_user_login'),
-    # path("api/products/<int:pk>/", views.product_detail_api, name="product-detail-api"),
-    # path("api/products/<int:product_id>/variants/", views.product_variants_api, name="product-variants-api"),
-    # path("api/products/<int:product_id>/options/", views.product_options_api, name="product-options-api"),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path("api/products/<slug:product>/", api_view.product_detail_api, name="product-detail-api"),
+    path("api/products/<slug:product>/variants/", api_view.product_variants_api, name="product-variants-api"),
+    path("api/products/<slug:product>/options/", api_view.product_options_api, name="product-options-api"),
+    path("api/products/<slug:product>/variants/resolve/", api_view.product_variant_resolve_api, name="product-variant-resolve-api"),
+    path(f"{settings.MEDIA_URL.lstrip('/')}{renditions.PREFIX}/<int:width>/<path:name>", views.media_rendition, name="media_rendition"),
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:name>", views.media_file, name="media_file"),
+]
 
 
 